@@ -7,9 +7,10 @@ import argparse
 from bson import ObjectId
 from datetime import datetime, timezone
 from abc import ABC
-from pydantic import ConfigDict, Field
+from jinja2 import Template
+from pydantic import ConfigDict, Field, PrivateAttr
 from typing import Optional, Literal, Any, Dict, List, Union
-from .thread import UserMessage, Thread
+from .thread import UserMessage, Thread, THREAD_MESSAGE_STORAGE
 from .tool import get_tools_from_api_files, get_tools_from_mongo, Tool
 from .mongo import Document, Collection, get_collection
 
@@ -53,6 +54,8 @@ class Agent(User):
     
     test_args: Optional[List[Dict[str, Any]]] = None
 
+    # last rendered system message, as ((template, updatedAt, kwargs), message)
+    _system_message: Optional[tuple] = PrivateAttr(default=None)
 
     def __init__(self, **data):
         if isinstance(data.get('owner'), str):
@@ -99,14 +102,23 @@ class Agent(User):
         return super().load(username=username, db=db)
 
     def request_thread(self, key=None, user=None, db="STAGE"):
-        thread = Thread(
+        thread = self._new_thread(key, user, db)
+        thread.save()
+        return thread
+
+    async def async_request_thread(self, key=None, user=None, db="STAGE"):
+        thread = self._new_thread(key, user, db)
+        await thread.async_save()
+        return thread
+
+    def _new_thread(self, key, user, db):
+        return Thread(
             db=db,
             key=key,
             agent=self.id,
             user=user,
+            message_storage=THREAD_MESSAGE_STORAGE,
         )
-        thread.save()
-        return thread
 
     def get_tools(self, db="STAGE"):
         return {
@@ -114,9 +126,20 @@ class Agent(User):
             for k, v in (self.tools or {}).items()
         }
 
-    # def get_system_message(self):
-    #     system_message = f"{self.description}\n\n{self.instructions}\n\n{generic_instructions}"
-    #     return system_message
+    def get_system_message(self, template: Template, **kwargs) -> str:
+        """
+        Render a system message template for this agent, cached until the agent document changes.
+        """
+        key = (template, self.updatedAt, tuple(sorted(kwargs.items())))
+        if self._system_message is None or self._system_message[0] != key:
+            message = template.render(
+                name=self.name,
+                description=self.description,
+                instructions=self.instructions,
+                **kwargs
+            )
+            self._system_message = (key, message)
+        return self._system_message[1]
 
 
 def get_agents_from_api_files(root_dir: str = None, agents: List[str] = None, include_inactive: bool = False) -> Dict[str, Agent]:
@@ -7,12 +7,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader, HTTPBearer
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
 
 from eve import auth
-from eve.tool import Tool, get_tools_from_mongo
+from eve.tool import Tool
 from eve.llm import UpdateType, UserMessage, async_prompt_thread, async_title_thread
 from eve.thread import Thread
-from eve.mongo import serialize_document
+from eve.mongo import serialize_document, close_mongo_clients
 from eve.agent import Agent
 from eve.user import User
 
@@ -28,7 +29,13 @@ bearer_scheme = HTTPBearer(auto_error=False)
 background_tasks: BackgroundTasks = BackgroundTasks()
 
 # FastAPI setup
-web_app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # close the pooled mongo clients on shutdown
+    close_mongo_clients()
+
+web_app = FastAPI(lifespan=lifespan)
 web_app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -78,15 +85,15 @@ async def handle_chat(
 
     # tools = get_tools_from_mongo(db=db)
     
-    user = User.from_mongo(str(user_id), db=db)
-    agent = Agent.from_mongo(str(agent_id), db=db)
+    user = await User.async_from_mongo(str(user_id), db=db)
+    agent = await Agent.async_from_mongo(str(agent_id), db=db)
     tools = agent.get_tools()
 
     if not thread_id:
-        thread = agent.request_thread(db=db, user=user.id)
+        thread = await agent.async_request_thread(db=db, user=user.id)
         background_tasks.add_task(async_title_thread, thread, user_message)
     else:
-        thread = Thread.from_mongo(str(thread_id), db=db)
+        thread = await Thread.async_from_mongo(str(thread_id), db=db)
 
     try:
         async def async_run_prompt():
@@ -116,18 +123,44 @@ async def stream_chat(
     request: ChatRequest,
     auth: dict = Depends(auth.authenticate),
 ):
-    user_messages = UserMessage(**request.user_message)
-    
+    user_message = UserMessage(**request.user_message)
+
+    user = await User.async_from_mongo(str(auth.userId), db=db)
+    agent = await Agent.async_from_mongo(str(request.agent_id), db=db)
+    tools = agent.get_tools()
+
+    if not request.thread_id:
+        thread = await agent.async_request_thread(db=db, user=user.id)
+    else:
+        thread = await Thread.async_from_mongo(str(request.thread_id), db=db)
+
     async def event_generator():
         async for update in async_prompt_thread(
             db=db,
-            user_id=auth.userId,
-            thread_name=request.thread_name,
-            user_messages=user_messages,
-            tools=get_tools_from_mongo(db=db),
-            provider="anthropic",
+            user=user,
+            agent=agent,
+            thread=thread,
+            user_messages=user_message,
+            tools=tools,
+            force_reply=True,
+            model="claude-3-5-sonnet-20241022",
+            stream=True,
         ):
-            if update.type == UpdateType.ASSISTANT_MESSAGE:
+            if update.type in (UpdateType.START_PROMPT, UpdateType.UPDATE_COMPLETE):
+                continue
+            elif update.type == UpdateType.ASSISTANT_TEXT_DELTA:
+                data = {
+                    "type": str(update.type),
+                    "text": update.text,
+                }
+            elif update.type == UpdateType.TOOL_CALL_START:
+                data = {
+                    "type": str(update.type),
+                    "tool": update.tool_name,
+                    "tool_index": update.tool_index,
+                    "args": update.args,
+                }
+            elif update.type == UpdateType.ASSISTANT_MESSAGE:
                 data = {
                     "type": str(update.type),
                     "content": update.message.content,
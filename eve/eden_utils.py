@@ -1,12 +1,17 @@
 import os
 import re
+import copy
 import json
 import time
 import math
 import magic
 import httpx
 import random
+import asyncio
+import weakref
 import base64
+import hashlib
+import threading
 import pathlib
 import textwrap
 import requests
@@ -18,12 +23,14 @@ from bson import ObjectId
 from datetime import datetime
 from pprint import pformat
 from moviepy.editor import VideoFileClip, ImageClip, AudioClip
-from tqdm import tqdm
 from PIL import Image, ImageFont, ImageDraw
 from io import BytesIO
+from collections import OrderedDict
+from functools import cached_property
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from . import s3
+from .file_cache import file_cache
 
 
 def get_full_url(filename, db: str):
@@ -33,8 +40,12 @@ def prepare_result(result, db: str, summarize=False):
     if isinstance(result, dict):
         if "error" in result:
             return result
+        # work on a copy, so results render the same every time they are prepared
+        result = dict(result)
         if "mediaAttributes" in result:
-            result["mediaAttributes"].pop("blurhash", None)
+            result["mediaAttributes"] = {
+                k: v for k, v in result["mediaAttributes"].items() if k != "blurhash"
+            }
         if "filename" in result:
             filename = result.pop("filename")
             url = get_full_url(filename, db)
@@ -49,88 +60,476 @@ def prepare_result(result, db: str, summarize=False):
         return result
 
 
-def upload_result(result, db: str, save_thumbnails=False, save_blurhash=False):
+# shared pool for uploading the files of a result, separate from the media pool their uploads wait on
+upload_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EDEN_UPLOAD_WORKERS", 8)))
+
+
+def _get_result_files(result):
     if isinstance(result, dict):
-        return {k: upload_result(v, db, save_thumbnails=save_thumbnails, save_blurhash=save_blurhash) for k, v in result.items()}
+        return [f for v in result.values() for f in _get_result_files(v)]
     elif isinstance(result, list):
-        return [upload_result(item, db, save_thumbnails=save_thumbnails, save_blurhash=save_blurhash) for item in result]
+        return [f for item in result for f in _get_result_files(item)]
     elif isinstance(result, str) and is_file(result):
-        return upload_media(result, db, save_thumbnails=save_thumbnails, save_blurhash=save_blurhash)
+        return [result]
+    else:
+        return []
+
+
+def _replace_result_files(result, uploads):
+    if isinstance(result, dict):
+        return {k: _replace_result_files(v, uploads) for k, v in result.items()}
+    elif isinstance(result, list):
+        return [_replace_result_files(item, uploads) for item in result]
+    elif isinstance(result, str) and result in uploads:
+        # a file may appear more than once, but each occurrence gets its own copy
+        return copy.deepcopy(uploads[result])
     else:
         return result
 
 
+def upload_result(result, db: str, save_thumbnails=False, save_blurhash=False):
+    """
+    Upload every file in a result concurrently, replacing each with its filename and media attributes.
+    """
+    files = dict.fromkeys(_get_result_files(result))
+    futures = {
+        f: upload_executor.submit(upload_media, f, db, save_thumbnails=save_thumbnails, save_blurhash=save_blurhash)
+        for f in files
+    }
+    uploads = {f: future.result() for f, future in futures.items()}
+    return _replace_result_files(result, uploads)
+
+
+async def async_upload_result(result, db: str, save_thumbnails=False, save_blurhash=False):
+    """
+    Async version of upload_result.
+    """
+    files = list(dict.fromkeys(_get_result_files(result)))
+    uploads = await asyncio.gather(*[
+        s3.run_async(upload_media, f, db, save_thumbnails=save_thumbnails, save_blurhash=save_blurhash)
+        for f in files
+    ])
+    return _replace_result_files(result, dict(zip(files, uploads)))
+
+
+# thumbnail widths saved for every image and video, each in both formats
+THUMBNAIL_WIDTHS = [384, 768, 1024, 2560]
+THUMBNAIL_FORMATS = {".webp": "WEBP", ".jpg": "JPEG"}
+
+# shared pool for encoding and uploading media
+media_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EDEN_MEDIA_WORKERS", 16)))
+
+
+def get_thumbnail_ladder(image, widths=THUMBNAIL_WIDTHS, max_height=2560):
+    """
+    Resize an image to each width, largest first, deriving each size from the previous one.
+    Widths at or above the width of the image get the original, which is never upscaled or
+    limited to max_height.
+    """
+    thumbnails = {}
+    img = image
+    for width in sorted(widths, reverse=True):
+        if width >= image.width:
+            thumbnails[width] = image
+            continue
+        # sizes are computed from the original, so they match resizing it directly
+        size = _thumbnail_size(image.size, (width, max_height))
+        if size != img.size:
+            img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        thumbnails[width] = img
+    return thumbnails
+
+
+def _thumbnail_size(size, box):
+    """
+    The size Image.thumbnail gives an image of size within box.
+    """
+    width, height = size
+    x, y = box
+    if x >= width and y >= height:
+        return size
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
+
+
 def upload_media(output, db, save_thumbnails=True, save_blurhash=True):
-    file_url, sha = s3.upload_file(output, db=db)
-    filename = file_url.split("/")[-1]
+    media = MediaFile(output)
+    media.sha256, media.mime_type  # download, read, hash and sniff the file once, before it is shared across threads
+    file_upload = media_executor.submit(media.upload, db)
 
-    media_attributes, thumbnail = get_media_attributes(output)
+    # the probed frame is a copy of this call's own, so thumbnails and the blurhash never touch
+    # anything the upload thread reads
+    media_attributes, thumbnail = media.probe()
 
+    # encode thumbnails while the file uploads
+    encodings = {}
     if save_thumbnails and thumbnail:
-        for width in [384, 768, 1024, 2560]:
-            img = thumbnail.copy()
-            img.thumbnail(
-                (width, 2560), Image.Resampling.LANCZOS
-            ) if width < thumbnail.width else thumbnail
-            img_bytes = PIL_to_bytes(img)
-            s3.upload_buffer(img_bytes, name=f"{sha}_{width}", file_type=".webp", db=db)
-            s3.upload_buffer(img_bytes, name=f"{sha}_{width}", file_type=".jpg", db=db)
+        for width, img in get_thumbnail_ladder(thumbnail).items():
+            for file_type, ext in THUMBNAIL_FORMATS.items():
+                encodings[(width, file_type)] = media_executor.submit(PIL_to_bytes, img, ext=ext)
+
+    file_url, sha = file_upload.result()
+    filename = file_url.split("/")[-1]
+
+    thumbnail_uploads = [
+        media_executor.submit(
+            s3.upload_buffer, encoding.result(), name=f"{sha}_{width}", file_type=file_type, db=db
+        )
+        for (width, file_type), encoding in encodings.items()
+    ]
 
     if save_blurhash and thumbnail:
         try:
-            img = thumbnail.copy()
-            img.thumbnail((100, 100), Image.LANCZOS)
-            media_attributes["blurhash"] = blurhash.encode(np.array(thumbnail), 4, 4)
+            media_attributes["blurhash"] = get_blurhash(thumbnail)
         except Exception as e:
             print(f"Error encoding blurhash: {e}")
 
+    for thumbnail_upload in thumbnail_uploads:
+        thumbnail_upload.result()
+
     return {"filename": filename, "mediaAttributes": media_attributes}
 
 
-def get_media_attributes(file_path):
-    is_url = file_path.startswith("http://") or file_path.startswith("https://")
-    if is_url:
-        temp_file = tempfile.NamedTemporaryFile(delete=False)
-        file_path = download_file(file_path, temp_file.name, overwrite=True)
+# longest side of the image blurhash components are computed from
+BLURHASH_SIZE = 64
 
-    thumbnail = None
-    mime_type = magic.from_file(file_path, mime=True)
-    media_attributes = {
-        "mimeType": mime_type,
-    }
+_SRGB_TO_LINEAR = np.array([blurhash.srgb_to_linear(v) for v in range(256)], dtype=np.float32)
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
 
-    if "image" in mime_type:
-        image = Image.open(file_path)
-        thumbnail = image.copy()
-        width, height = thumbnail.size
-        media_attributes.update(
-            {"width": width, "height": height, "aspectRatio": width / height}
-        )
 
-    elif "video" in mime_type:
-        video = VideoFileClip(file_path)
-        thumbnail = Image.fromarray(video.get_frame(0).astype("uint8"), "RGB")
-        width, height = thumbnail.size
-        media_attributes.update(
-            {
-                "width": width,
-                "height": height,
-                "aspectRatio": width / height,
-                "duration": video.duration,
+def _base83(value, length):
+    return "".join(_BASE83[value // 83 ** (length - i) % 83] for i in range(1, length + 1))
+
+
+def get_blurhash(image, components_x=4, components_y=4, size=BLURHASH_SIZE):
+    """
+    Blurhash of a PIL image, computed on a copy area-downsampled in linear colour to at most about size pixels a side.
+    """
+    pixels = np.asarray(image.convert("RGB"))
+    # a factor per axis, so the short side of extreme aspect ratios never rounds down to 0
+    factor_y, factor_x = (max(1, math.ceil(side / size)) for side in pixels.shape[:2])
+    height, width = pixels.shape[0] // factor_y, pixels.shape[1] // factor_x
+
+    # average each factor_y x factor_x block, summing rows then columns
+    linear = _SRGB_TO_LINEAR[pixels[:height * factor_y, :width * factor_x]]
+    linear = linear.reshape(height, factor_y, width * factor_x, 3).sum(axis=1)
+    linear = linear.reshape(height, width, factor_x, 3).sum(axis=2, dtype=np.float64) / (factor_y * factor_x)
+
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    components = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, linear).reshape(-1, 3) / (width * height)
+    components[1:] *= 2
+
+    dc, ac = components[0], components[1:]
+    dc_value = (blurhash.linear_to_srgb(dc[0]) << 16) + (blurhash.linear_to_srgb(dc[1]) << 8) + blurhash.linear_to_srgb(dc[2])
+    quant_max_ac = int(max(0, min(82, math.floor(np.abs(ac).max(initial=0.0) * 166 - 0.5))))
+    ac = ac / ((quant_max_ac + 1) / 166.0)
+    ac = np.clip(np.floor(np.sign(ac) * np.sqrt(np.abs(ac)) * 9.0 + 9.5), 0, 18).astype(int)
+    ac_values = ac[:, 0] * 19 * 19 + ac[:, 1] * 19 + ac[:, 2]
+
+    return (
+        _base83((components_x - 1) + (components_y - 1) * 9, 1)
+        + _base83(quant_max_ac, 1)
+        + _base83(dc_value, 4)
+        + "".join(_base83(int(v), 2) for v in ac_values)
+    )
+
+
+# number of media attributes kept in memory, keyed by content sha256
+MEDIA_PROBE_CACHE_SIZE = int(os.getenv("EDEN_MEDIA_PROBE_CACHE_SIZE", 64))
+
+_media_probes = OrderedDict()
+_media_probes_lock = threading.Lock()
+
+
+def _ffmpeg_probe(file_path, first_frame=False):
+    """
+    Probe a video or audio file with a single ffmpeg run: its duration and codecs are parsed
+    from the log of the input, and the first video frame is optionally decoded along the way.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-nostdin", "-i", file_path]
+    if first_frame:
+        cmd += ["-map", "0:v:0?", "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "-"]
+    else:
+        cmd += ["-t", "0", "-f", "null", "-"]
+    process = subprocess.run(cmd, capture_output=True)
+    log = process.stderr.decode(errors="replace")
+    if "Input #0" not in log:
+        raise Exception(f"Error probing {file_path}: {log.strip()[-500:]}")
+
+    # only the input section, the output streams are listed after it
+    input_log = log.split("Stream mapping:")[0].split("Output #0")[0]
+    info = {}
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", input_log)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    for codec_type in ("video", "audio"):
+        codec = re.search(rf"Stream #\S+.*?: {codec_type.capitalize()}: (\w+)", input_log)
+        if codec:
+            info[f"{codec_type}_codec"] = codec.group(1)
+
+    frame = None
+    if first_frame and "video_codec" in info:
+        if not process.stdout:
+            raise Exception(f"Error decoding the first frame of {file_path}: {log.strip()[-500:]}")
+        frame = Image.open(BytesIO(process.stdout)).convert("RGB")
+    return info, frame
+
+
+class MediaFile:
+    """
+    A local media file or url, read once and shared by upload, attribute extraction, thumbnails and blurhash.
+    Its bytes, mime type, sha256 and decoded image are loaded lazily. Urls are downloaded once, through the
+    file cache, and then treated as local files. Files too large to upload from memory are never read whole.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.is_url = file_path.startswith("http://") or file_path.startswith("https://")
+
+    @cached_property
+    def local_path(self):
+        return file_cache.fetch(self.file_path) if self.is_url else self.file_path
+
+    @cached_property
+    def data(self):
+        if os.path.getsize(self.local_path) > s3.STREAMING_UPLOAD_THRESHOLD:
+            return None
+        with open(self.local_path, "rb") as f:
+            return f.read()
+
+    @cached_property
+    def head(self):
+        if self.data is not None:
+            return self.data[:8192]
+        with open(self.local_path, "rb") as f:
+            return f.read(8192)
+
+    @cached_property
+    def mime_type(self):
+        return magic.from_buffer(self.head, mime=True)
+
+    @cached_property
+    def sha256(self):
+        if self.data is not None:
+            return hashlib.sha256(self.data).hexdigest()
+        hasher = hashlib.sha256()
+        with open(self.local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @cached_property
+    def image(self):
+        """The decoded image, for image files"""
+        if "image" not in self.mime_type:
+            return None
+        image = Image.open(BytesIO(self.data) if self.data is not None else self.local_path)
+        image.load()
+        return image
+
+    @property
+    def size(self):
+        return self.image.size if self.image else None
+
+    def upload(self, db):
+        """Upload the file, without reading or hashing it again"""
+        if self.is_url and s3.parse_bucket_url(self.file_path):
+            # already in one of our buckets, kept or copied server-side
+            return s3.upload_file(self.file_path, db=db)
+        file_type = ".safetensors" if self.file_path.endswith(".safetensors") else None
+        if self.data is None:
+            return s3.upload_file_streaming(self.local_path, self.sha256, file_type, db)
+        return s3.upload_buffer(self.data, self.sha256, file_type, db, mime_type=self.mime_type)
+
+    def probe(self):
+        """
+        Get the media attributes and, for images and videos, the (first) frame.
+        Audio and video are probed with a single ffmpeg run, and videos decode only their first frame.
+        Attributes are cached by content sha256. Frames are decoded for every call and never shared,
+        so callers may modify them.
+        """
+        key = self.sha256
+        with _media_probes_lock:
+            media_attributes = _media_probes.get(key)
+            if media_attributes is not None:
+                _media_probes.move_to_end(key)
+
+        mime_type = self.mime_type
+        info, frame = {}, None
+        if self.image:
+            # a copy, so callers never share the image with the file or each other
+            frame = self.image.copy()
+        elif "video" in mime_type:
+            # the decoded frame has any rotation applied
+            info, frame = _ffmpeg_probe(self.local_path, first_frame=True)
+        elif "audio" in mime_type and media_attributes is None:
+            info, _ = _ffmpeg_probe(self.local_path)
+
+        if media_attributes is None:
+            media_attributes = {
+                "mimeType": mime_type,
             }
+            if "duration" in info:
+                media_attributes["duration"] = info["duration"]
+            if frame is not None:
+                width, height = frame.size
+                media_attributes.update(
+                    {"width": width, "height": height, "aspectRatio": width / height}
+                )
+            if frame is not None and "video_codec" in info:
+                media_attributes["codec"] = info["video_codec"]
+            elif "audio_codec" in info:
+                media_attributes["codec"] = info["audio_codec"]
+
+            with _media_probes_lock:
+                _media_probes[key] = media_attributes
+                while len(_media_probes) > MEDIA_PROBE_CACHE_SIZE:
+                    _media_probes.popitem(last=False)
+
+        return dict(media_attributes), frame
+
+
+def get_media_attributes(file_path):
+    """
+    Get the media attributes of a local file or url and, for images and videos, its (first) frame.
+    """
+    return MediaFile(file_path).probe()
+
+
+# http/2 needs the optional h2 package, downloads fall back to http/1.1 without it
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# maximum number of concurrent async downloads per event loop
+DOWNLOAD_CONCURRENCY = int(os.getenv("EDEN_DOWNLOAD_CONCURRENCY", 8))
+
+# attempts per download, retrying dropped connections and 5xx responses with exponential backoff
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv("EDEN_DOWNLOAD_MAX_ATTEMPTS", 5))
+
+DOWNLOAD_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# pooled sync http client, shared by all threads of this process
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# pooled async http clients and download semaphores, one per event loop
+_async_http_clients = weakref.WeakKeyDictionary()
+
+
+def _reset_http_clients():
+    """
+    Drop all pooled http clients, so a forked child never reuses its parent's connections.
+    """
+    global _http_client, _http_client_lock
+    _http_client = None
+    _http_client_lock = threading.Lock()
+    _async_http_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_http_clients)
+
+
+def get_http_client():
+    """
+    Get the pooled sync http client, creating it lazily on first use in this process.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    http2=HTTP2,
+                    follow_redirects=True,
+                    timeout=DOWNLOAD_TIMEOUT,
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+                )
+    return _http_client
+
+
+def get_async_http_client():
+    """
+    Get the pooled async http client of the running event loop, with its download semaphore.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_http_clients:
+        client = httpx.AsyncClient(
+            http2=HTTP2,
+            follow_redirects=True,
+            timeout=DOWNLOAD_TIMEOUT,
+            limits=httpx.Limits(max_connections=DOWNLOAD_CONCURRENCY, max_keepalive_connections=DOWNLOAD_CONCURRENCY),
         )
-        video.close()
+        _async_http_clients[loop] = (client, asyncio.Semaphore(DOWNLOAD_CONCURRENCY))
+    return _async_http_clients[loop]
 
-    elif "audio" in mime_type:
-        media_attributes.update({"duration": get_media_duration(file_path)})
 
-    if is_url:
-        os.remove(file_path)
+class RetryableDownloadError(Exception):
+    def __init__(self, message, restart=False):
+        super().__init__(message)
+        self.restart = restart  # whether the partial file is discarded before retrying
 
-    return media_attributes, thumbnail
+
+def _range_headers(offset):
+    return {"Range": f"bytes={offset}-"} if offset else {}
+
+
+def _download_mode(url, response, offset):
+    """
+    Check a download response, returning the mode to open the local file with: append if
+    the server resumed from offset, otherwise write from the start.
+    """
+    if response.status_code == 404:
+        raise FileNotFoundError(f"No file found at {url}")
+    if response.status_code == 416:
+        # the partial file is unusable, start over
+        raise RetryableDownloadError(f"Range not satisfiable for {url}", restart=True)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableDownloadError(
+            f"Failed to download from {url}. Status code: {response.status_code}"
+        )
+    if response.status_code == 206 and offset:
+        content_range = response.headers.get("Content-Range", "")
+        if content_range.startswith(f"bytes {offset}-"):
+            return "ab"
+        raise RetryableDownloadError(f"Unexpected Content-Range for {url}: {content_range}", restart=True)
+    if response.status_code != 200:
+        raise Exception(
+            f"Failed to download from {url}. Status code: {response.status_code}"
+        )
+    return "wb"
+
+
+def _download_retry(local_filepath, attempt, error):
+    """
+    Decide whether a failed download attempt is retried, returning the backoff delay.
+    """
+    if getattr(error, "restart", False):
+        local_filepath.write_bytes(b"")
+    if attempt == DOWNLOAD_MAX_ATTEMPTS:
+        raise Exception(f"Error downloading file: {error}")
+    delay = 2 ** (attempt - 1) + random.uniform(0, 1)
+    print(f"Download attempt {attempt} failed because: {error}. Retrying in {delay:.1f} seconds...")
+    return delay
 
 
 def download_file(url, local_filepath, overwrite=False):
+    """
+    Download a url to a local file with the pooled http client, resuming interrupted
+    transfers with range requests.
+    """
     local_filepath = pathlib.Path(local_filepath)
     local_filepath.parent.mkdir(parents=True, exist_ok=True)
 
@@ -140,31 +539,48 @@ def download_file(url, local_filepath, overwrite=False):
     else:
         print(f"Downloading file from {url} to {local_filepath}")
 
-    try:
-        with httpx.stream("GET", url, follow_redirects=True) as response:
-            if response.status_code == 404:
-                raise FileNotFoundError(f"No file found at {url}")
-            if response.status_code != 200:
-                raise Exception(
-                    f"Failed to download from {url}. Status code: {response.status_code}"
-                )
+    client = get_http_client()
+    local_filepath.write_bytes(b"")
+    for attempt in range(1, DOWNLOAD_MAX_ATTEMPTS + 1):
+        offset = local_filepath.stat().st_size
+        try:
+            with client.stream("GET", url, headers=_range_headers(offset)) as response:
+                mode = _download_mode(url, response, offset)
+                with open(local_filepath, mode) as f:
+                    for data in response.iter_bytes():
+                        f.write(data)
+            return str(local_filepath)
+        except (httpx.TransportError, RetryableDownloadError) as e:
+            time.sleep(_download_retry(local_filepath, attempt, e))
+        except Exception as e:
+            raise Exception(f"Error downloading file: {e}")
+
+
+async def async_download_file(url, local_filepath, overwrite=False):
+    """
+    Async version of download_file, on the pooled async http client of the running loop.
+    """
+    local_filepath = pathlib.Path(local_filepath)
+    local_filepath.parent.mkdir(parents=True, exist_ok=True)
 
-            total = int(response.headers["Content-Length"])
-            with open(local_filepath, "wb") as f, tqdm(
-                total=total, unit_scale=True, unit_divisor=1024, unit="B"
-            ) as progress:
-                num_bytes_downloaded = response.num_bytes_downloaded
-                for data in response.iter_bytes():
-                    f.write(data)
-                    progress.update(
-                        response.num_bytes_downloaded - num_bytes_downloaded
-                    )
-                    num_bytes_downloaded = response.num_bytes_downloaded
+    if local_filepath.exists() and not overwrite:
         return str(local_filepath)
-    except httpx.HTTPStatusError as e:
-        raise Exception(f"HTTP error: {e}")
-    except Exception as e:
-        raise Exception(f"Error downloading file: {e}")
+
+    client, semaphore = get_async_http_client()
+    local_filepath.write_bytes(b"")
+    for attempt in range(1, DOWNLOAD_MAX_ATTEMPTS + 1):
+        offset = local_filepath.stat().st_size
+        try:
+            async with semaphore, client.stream("GET", url, headers=_range_headers(offset)) as response:
+                mode = _download_mode(url, response, offset)
+                with open(local_filepath, mode) as f:
+                    async for data in response.aiter_bytes():
+                        f.write(data)
+            return str(local_filepath)
+        except (httpx.TransportError, RetryableDownloadError) as e:
+            await asyncio.sleep(_download_retry(local_filepath, attempt, e))
+        except Exception as e:
+            raise Exception(f"Error downloading file: {e}")
 
 
 def exponential_backoff(
@@ -264,6 +680,113 @@ def image_to_base64(file_path, max_size, quality=95, truncate=False):
     return data
 
 
+class ImageBlockCache:
+    """
+    LRU cache of rendered image blocks, held in memory and backed by a directory of json files.
+    Keys are content addresses, so entries never go stale.
+    """
+
+    def __init__(self, directory, max_items=256, max_disk_items=4096):
+        self.directory = pathlib.Path(directory)
+        self.max_items = max_items
+        self.max_disk_items = max_disk_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url, max_size, quality, schema, truncate=False):
+        return hashlib.sha256(f"{url}|{max_size}|{quality}|{schema}|{truncate}".encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        path = self.directory / f"{key}.json"
+        try:
+            with open(path) as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        path.touch()
+        self._set_memory(key, value)
+        return value
+
+    def set(self, key, value):
+        self._set_memory(key, value)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # write to a temp file and rename, so readers never see partial entries
+            with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as f:
+                json.dump(value, f)
+            os.replace(f.name, self.directory / f"{key}.json")
+            self._evict_disk()
+        except OSError as e:
+            print(f"Failed to write image block cache: {e}")
+
+    def _set_memory(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _evict_disk(self):
+        entries = list(self.directory.glob("*.json"))
+        if len(entries) <= self.max_disk_items:
+            return
+        entries.sort(key=lambda p: p.stat().st_mtime)
+        for path in entries[: len(entries) - self.max_disk_items]:
+            path.unlink(missing_ok=True)
+
+
+image_block_cache = ImageBlockCache(
+    os.getenv("EDEN_IMAGE_BLOCK_CACHE_DIR", "/tmp/eden_image_block_cache"),
+    max_items=int(os.getenv("EDEN_IMAGE_BLOCK_CACHE_SIZE", 256)),
+)
+
+
+def is_image_block_cached(url, schema, max_size=512, quality=95, truncate=False):
+    key = ImageBlockCache.make_key(url, max_size, quality, schema, truncate)
+    return image_block_cache.get(key) is not None
+
+
+def get_image_block(url, schema, max_size=512, quality=95, truncate=False):
+    """
+    Get the image block of a media url for an LLM provider schema ("anthropic" or "openai"),
+    along with the media's mime type. Downloads and renders the media only on a cache miss.
+    """
+    key = ImageBlockCache.make_key(url, max_size, quality, schema, truncate)
+    entry = image_block_cache.get(key)
+    if entry is not None:
+        return entry
+
+    file_path = file_cache.fetch(url)
+    mime_type = magic.from_file(file_path, mime=True)
+    data = image_to_base64(file_path, max_size=max_size, quality=quality, truncate=truncate)
+
+    if schema == "anthropic":
+        block = {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": "image/jpeg",
+                "data": data,
+            },
+        }
+    elif schema == "openai":
+        block = {
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{data}"},
+        }
+    else:
+        raise ValueError(f"Unknown schema {schema}")
+
+    entry = {"mime_type": mime_type, "block": block}
+    image_block_cache.set(key, entry)
+    return entry
+
+
 def deep_filter(current, changes):
     if not isinstance(current, dict) or not isinstance(changes, dict):
         return changes if changes != current else None
@@ -0,0 +1,161 @@
+import os
+import asyncio
+import weakref
+import hashlib
+import pathlib
+import tempfile
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import Future
+
+
+FILE_CACHE_DIR = os.getenv("EDEN_FILE_CACHE_DIR", "/tmp/eden_file_cache")
+FILE_CACHE_MAX_BYTES = int(os.getenv("EDEN_FILE_CACHE_MAX_BYTES", 2 * 1024**3))
+
+
+class FileCache:
+    """
+    Bounded local cache of downloaded files.
+
+    Files are keyed by a hash of their full url (keeping the extension), evicted least
+    recently used first once the directory exceeds max_bytes, and written through a
+    temp file and rename so readers never see partial downloads. Concurrent sync requests
+    for the same url within a process share a single download, and so do concurrent async
+    requests on the same event loop. A sync and an async request do not share, since a sync
+    caller waiting on a download run by its own event loop would block that loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        self._in_flight = {}
+        self._async_in_flight = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def path_for(self, url: str) -> pathlib.Path:
+        suffix = pathlib.PurePosixPath(urlparse(url).path).suffix[:16]
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()}{suffix}"
+
+    def get(self, url: str):
+        """
+        Get the local path of a cached url, or None if it is not cached.
+        """
+        path = self.path_for(url)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return str(path)
+
+    def fetch(self, url: str) -> str:
+        """
+        Get the local path of a url, downloading it on a cache miss.
+        """
+        path = self.get(url)
+        if path:
+            return path
+
+        with self._lock:
+            future = self._in_flight.get(url)
+            owner = future is None
+            if owner:
+                future = self._in_flight[url] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            path = self._download(url)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(url, None)
+
+    async def async_fetch(self, url: str) -> str:
+        """
+        Async version of fetch, downloading with the pooled async http client.
+        """
+        path = self.get(url)
+        if path:
+            return path
+
+        loop = asyncio.get_running_loop()
+        in_flight = self._async_in_flight.setdefault(loop, {})
+        task = in_flight.get(url)
+        if task is None:
+            task = in_flight[url] = loop.create_task(self._async_download(url))
+            task.add_done_callback(lambda _: in_flight.pop(url, None))
+        # shield the shared download from cancellation of any one caller
+        return await asyncio.shield(task)
+
+    def _download(self, url: str) -> str:
+        from .eden_utils import download_file
+
+        path, temp_path = self.path_for(url), self._temp_path()
+        try:
+            download_file(url, temp_path, overwrite=True)
+            return self._commit(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def _async_download(self, url: str) -> str:
+        from .eden_utils import async_download_file
+
+        path, temp_path = self.path_for(url), self._temp_path()
+        try:
+            await async_download_file(url, temp_path, overwrite=True)
+            return self._commit(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _temp_path(self) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        return temp_path
+
+    def _commit(self, temp_path: str, path: pathlib.Path) -> str:
+        os.replace(temp_path, path)
+        self._add_bytes(path.stat().st_size)
+        return str(path)
+
+    def _add_bytes(self, size: int):
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries, sum(size for _, size, _ in entries)
+
+    def _evict(self):
+        # rescan, since other processes may share the directory
+        entries, total = self._scan()
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total_bytes = total
+
+
+file_cache = FileCache(FILE_CACHE_DIR, FILE_CACHE_MAX_BYTES)
@@ -1,9 +1,12 @@
 import re
+import json
 import sentry_sdk
 from pprint import pprint
 import traceback
 import os
 import asyncio
+import weakref
+import threading
 import openai
 import anthropic
 from enum import Enum
@@ -20,28 +23,29 @@ from . import sentry_sdk
 from .tool import Tool
 from .user import User
 from .agent import Agent
+from .llm_clients import get_async_anthropic_client, get_async_openai_client
 from .thread import (
     UserMessage, 
     AssistantMessage, 
     ToolCall, 
-    Thread
+    Thread,
+    async_prefetch_media
 )
 
 
-async def async_anthropic_prompt(
-    messages: List[Union[UserMessage, AssistantMessage]], 
-    system_message: Optional[str] = "You are a helpful assistant.", 
-    model: str = "claude-3-5-sonnet-20241022",
-    response_model: Optional[type[BaseModel]] = None, 
-    tools: Dict[str, Tool] = None,
-    db: str = "STAGE"
-):
+# anthropic prompt cache breakpoint, caching everything up to and including the marked block
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+async def _anthropic_request(messages, system_message, model, response_model, tools):
     if not os.getenv("ANTHROPIC_API_KEY"):
         raise ValueError("ANTHROPIC_API_KEY env is not set")
 
-    messages_json = [
+    # gather all media concurrently, then render off the event loop
+    await async_prefetch_media(messages, "anthropic")
+    messages_json = await asyncio.to_thread(lambda: [
         item for msg in messages for item in msg.anthropic_schema()
-    ]
+    ])
 
     # print("--------------------------------")
     # pprint(messages_json)
@@ -50,49 +54,170 @@ async def async_anthropic_prompt(
     prompt = {
         "model": model,
         "max_tokens": 8192,
-        "messages": messages_json,
-        "system": system_message,
+        "messages": _add_cache_breakpoints(messages_json),
     }
 
-    anthropic_client = anthropic.AsyncAnthropic()
-    
+    if system_message:
+        prompt["system"] = [{"type": "text", "text": system_message, "cache_control": CACHE_CONTROL}]
+
     if tools or response_model:
         tools = [t.anthropic_schema(exclude_hidden=True) for t in (tools or {}).values()]
         if response_model:
             tools.append(openai_schema(response_model).anthropic_schema)
             prompt["tool_choice"] = {"type": "tool", "name": response_model.__name__}
+        tools[-1] = {**tools[-1], "cache_control": CACHE_CONTROL}
         prompt["tools"] = tools
 
+    return prompt
+
+
+def _add_cache_breakpoints(messages_json):
+    """
+    Mark prompt cache breakpoints on the last message, and on the last user message before it,
+    which ended the history of the previous call in the tool loop. Blocks are copied, since
+    image blocks are shared with the image block cache.
+    """
+    if not messages_json:
+        return messages_json
+    user_indices = [i for i, m in enumerate(messages_json) if m["role"] == "user"]
+    for i in {len(messages_json) - 1, *user_indices[-2:-1]}:
+        message = messages_json[i] = dict(messages_json[i])
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        else:
+            content = list(content)
+        content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+        message["content"] = content
+    return messages_json
+
+
+class PromptCacheStats:
+    """
+    Prompt cache usage of the Anthropic calls of this process, in input tokens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+
+    def record(self, usage):
+        created = getattr(usage, "cache_creation_input_tokens", None) or 0
+        read = getattr(usage, "cache_read_input_tokens", None) or 0
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += usage.input_tokens
+            self.cache_creation_input_tokens += created
+            self.cache_read_input_tokens += read
+        sentry_sdk.add_breadcrumb(
+            category="prompt_cache",
+            data={"input_tokens": usage.input_tokens, "cache_creation_input_tokens": created, "cache_read_input_tokens": read}
+        )
+
+    def stats(self):
+        with self._lock:
+            total = self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "cache_creation_input_tokens": self.cache_creation_input_tokens,
+                "cache_read_input_tokens": self.cache_read_input_tokens,
+                "hit_rate": self.cache_read_input_tokens / total if total else 0.0,
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+def _anthropic_result(response, db):
+    prompt_cache_stats.record(response.usage)
+    content = ". ".join([r.text for r in response.content if r.type == "text" and r.text])
+    tool_calls = [ToolCall.from_anthropic(r, db=db) for r in response.content if r.type == "tool_use"]
+    stop = response.stop_reason != "tool_use"
+    return content, tool_calls, stop
+
+
+async def async_anthropic_prompt(
+    messages: List[Union[UserMessage, AssistantMessage]], 
+    system_message: Optional[str] = "You are a helpful assistant.", 
+    model: str = "claude-3-5-sonnet-20241022",
+    response_model: Optional[type[BaseModel]] = None, 
+    tools: Dict[str, Tool] = None,
+    db: str = "STAGE"
+):
+    prompt = await _anthropic_request(messages, system_message, model, response_model, tools)
+
+    anthropic_client = get_async_anthropic_client()
     response = await anthropic_client.messages.create(**prompt)
 
     if response_model:
+        prompt_cache_stats.record(response.usage)
         return response_model(**response.content[0].input)
 
     else:
-        content = ". ".join([r.text for r in response.content if r.type == "text" and r.text])
-        tool_calls = [ToolCall.from_anthropic(r, db=db) for r in response.content if r.type == "tool_use"]
-        stop = response.stop_reason != "tool_use"
-        return content, tool_calls, stop
+        return _anthropic_result(response, db)
 
 
-async def async_openai_prompt(
+async def async_anthropic_prompt_stream(
     messages: List[Union[UserMessage, AssistantMessage]], 
     system_message: Optional[str] = "You are a helpful assistant.", 
-    model: str = "gpt-4o-mini", # "gpt-4o-2024-08-06",
-    response_model: Optional[type[BaseModel]] = None, 
-    tools: Dict[str, Tool] = {},
+    model: str = "claude-3-5-sonnet-20241022",
+    tools: Dict[str, Tool] = None,
     db: str = "STAGE"
 ):
+    """
+    Streaming version of async_anthropic_prompt. Yields text deltas as they arrive and each
+    ToolCall as soon as its tool_use block is complete, then a final (content, tool_calls, stop).
+    """
+    prompt = await _anthropic_request(messages, system_message, model, None, tools)
+
+    anthropic_client = get_async_anthropic_client()
+    has_text = new_block = False
+    async with anthropic_client.messages.stream(**prompt) as stream:
+        async for event in stream:
+            if event.type == "content_block_start" and event.content_block.type == "text":
+                # text blocks are joined like in the non-streaming response
+                new_block = True
+            elif event.type == "text" and event.text:
+                if new_block and has_text:
+                    yield ". "
+                new_block, has_text = False, True
+                yield event.text
+            elif event.type == "content_block_stop" and event.content_block.type == "tool_use":
+                yield ToolCall.from_anthropic(event.content_block, db=db)
+        response = await stream.get_final_message()
+
+    yield _anthropic_result(response, db)
+
+
+async def _openai_request(messages, system_message):
     if not os.getenv("OPENAI_API_KEY"):
         raise ValueError("OPENAI_API_KEY env is not set")
 
-    messages_json = [
+    await async_prefetch_media(messages, "openai")
+    messages_json = await asyncio.to_thread(lambda: [
         item for msg in messages for item in msg.openai_schema()
-    ]
+    ])
     if system_message:
         messages_json = [{"role": "system", "content": system_message}] + messages_json
 
-    openai_client = openai.AsyncOpenAI()
+    return messages_json
+
+
+async def async_openai_prompt(
+    messages: List[Union[UserMessage, AssistantMessage]], 
+    system_message: Optional[str] = "You are a helpful assistant.", 
+    model: str = "gpt-4o-mini", # "gpt-4o-2024-08-06",
+    response_model: Optional[type[BaseModel]] = None, 
+    tools: Dict[str, Tool] = {},
+    db: str = "STAGE"
+):
+    messages_json = await _openai_request(messages, system_message)
+
+    openai_client = get_async_openai_client()
     
     if response_model:
         response = await openai_client.beta.chat.completions.parse(
@@ -117,6 +242,64 @@ async def async_openai_prompt(
         return content, tool_calls, stop
 
 
+async def async_openai_prompt_stream(
+    messages: List[Union[UserMessage, AssistantMessage]], 
+    system_message: Optional[str] = "You are a helpful assistant.", 
+    model: str = "gpt-4o-mini",
+    tools: Dict[str, Tool] = {},
+    db: str = "STAGE"
+):
+    """
+    Streaming version of async_openai_prompt. Yields text deltas as they arrive and each
+    ToolCall as soon as its arguments are complete, then a final (content, tool_calls, stop).
+    """
+    messages_json = await _openai_request(messages, system_message)
+
+    openai_client = get_async_openai_client()
+    tools = [t.openai_schema(exclude_hidden=True) for t in tools.values()] if tools else None
+    response = await openai_client.chat.completions.create(
+        model=model,
+        messages=messages_json,
+        tools=tools,
+        stream=True
+    )
+
+    content, tool_calls, pending, finish_reason = [], [], None, None
+    async for chunk in response:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.delta.content:
+            content.append(choice.delta.content)
+            yield choice.delta.content
+        for delta in choice.delta.tool_calls or []:
+            # tool calls stream one after another, a new index completes the previous one
+            if pending and pending["index"] != delta.index:
+                tool_calls.append(_openai_stream_tool_call(pending, db))
+                yield tool_calls[-1]
+                pending = None
+            if pending is None:
+                pending = {"index": delta.index, "id": delta.id, "name": "", "arguments": ""}
+            pending["name"] += delta.function.name or ""
+            pending["arguments"] += delta.function.arguments or ""
+        finish_reason = choice.finish_reason or finish_reason
+
+    if pending:
+        tool_calls.append(_openai_stream_tool_call(pending, db))
+        yield tool_calls[-1]
+
+    yield "".join(content), tool_calls, finish_reason != "tool_calls"
+
+
+def _openai_stream_tool_call(tool_call, db):
+    return ToolCall(
+        id=tool_call["id"],
+        tool=tool_call["name"],
+        args=json.loads(tool_call["arguments"] or "{}"),
+        db=db,
+    )
+
+
 @retry(
     retry=retry_if_exception(lambda e: isinstance(e, (
         openai.RateLimitError, anthropic.RateLimitError
@@ -151,6 +334,24 @@ async def async_prompt(
             messages, system_message, model, response_model, tools, db
         )
 
+
+async def async_prompt_stream(
+    messages: List[Union[UserMessage, AssistantMessage]], 
+    system_message: Optional[str] = "You are a helpful assistant.", 
+    model: str = "claude-3-5-sonnet-20241022",
+    tools: Dict[str, Tool] = {},
+    db: str = "STAGE"
+):
+    """
+    Streaming version of async_prompt, yielding text deltas, ToolCalls and finally (content, tool_calls, stop).
+    """
+    if model.startswith("claude"):
+        stream = async_anthropic_prompt_stream(messages, system_message, model, tools, db)
+    else:
+        stream = async_openai_prompt_stream(messages, system_message, model, tools, db)
+    async for event in stream:
+        yield event
+
 def anthropic_prompt(messages, system_message, model, response_model=None, tools=None):
     return asyncio.run(async_anthropic_prompt(messages, system_message, model, response_model, tools))
 
@@ -167,6 +368,8 @@ def prompt(messages, system_message, model, response_model=None, tools=None):
 class UpdateType(str, Enum):
     START_PROMPT = "start_prompt"
     ASSISTANT_MESSAGE = "assistant_message"
+    ASSISTANT_TEXT_DELTA = "assistant_text_delta"
+    TOOL_CALL_START = "tool_call_start"
     TOOL_COMPLETE = "tool_complete"
     ERROR = "error"
     UPDATE_COMPLETE = "update_complete"
@@ -177,6 +380,9 @@ models = [
     "gpt-4o-2024-08-06"
 ]
 
+# seconds that thread writes may be held back and coalesced before being flushed
+THREAD_WRITE_BUFFER_WINDOW = float(os.getenv("THREAD_WRITE_BUFFER_WINDOW", 0.5))
+
 
 # todo: `msg.error` not `msg.message.error`
 class ThreadUpdate(BaseModel):
@@ -184,7 +390,9 @@ class ThreadUpdate(BaseModel):
     message: Optional[AssistantMessage] = None
     tool_name: Optional[str] = None
     tool_index: Optional[int] = None
+    args: Optional[Dict[str, Any]] = None
     result: Optional[Dict[str, Any]] = None
+    text: Optional[str] = None
     error: Optional[str] = None
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -209,6 +417,101 @@ This is a description of {{ name }}.
 {{ system_instructions }}
 </System Instructions>'''
 
+# compiled once, agents cache their rendered system message
+system_template = Template(template)
+
+# maximum number of tool calls running at once per user, and per tool, in this process
+TOOL_CALL_USER_CONCURRENCY = int(os.getenv("EDEN_TOOL_CALL_USER_CONCURRENCY", 4))
+TOOL_CALL_TOOL_CONCURRENCY = int(os.getenv("EDEN_TOOL_CALL_TOOL_CONCURRENCY", 8))
+
+# tool call semaphores by user and by tool, one set per event loop, only kept alive by the calls using them
+_tool_call_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_tool_call_semaphore(key, limit):
+    semaphores = _tool_call_semaphores.setdefault(asyncio.get_running_loop(), weakref.WeakValueDictionary())
+    semaphore = semaphores.get(key)
+    if semaphore is None:
+        semaphore = semaphores[key] = asyncio.Semaphore(limit)
+    return semaphore
+
+
+async def async_run_tool_call(
+    db: str,
+    user: User,
+    agent: Agent,
+    thread: Thread,
+    tools: Dict[str, Tool],
+    assistant_message: AssistantMessage,
+    t: int,
+    tool_call: ToolCall
+) -> ThreadUpdate:
+    """
+    Run one tool call of an assistant message to completion, recording its progress on the thread
+    """
+    try:
+        # get tool
+        tool = tools.get(tool_call.tool)
+        if not tool:
+            raise Exception(f"Tool {tool_call.tool} not found.")
+
+        user_semaphore = _get_tool_call_semaphore(("user", str(user.id)), TOOL_CALL_USER_CONCURRENCY)
+        tool_semaphore = _get_tool_call_semaphore(("tool", tool.key), TOOL_CALL_TOOL_CONCURRENCY)
+        async with user_semaphore, tool_semaphore:
+            # start task
+            task = await tool.async_start_task(
+                user.id, 
+                agent.id, 
+                tool_call.args, 
+                db=db
+            )
+
+            # update tool call with task id and status
+            await thread.async_update_tool_call(assistant_message.id, t, {
+                "task": ObjectId(task.id),
+                "status": "pending"
+            })
+            
+            # wait for task to complete
+            result = await tool.async_wait(task)
+
+        await thread.async_update_tool_call(assistant_message.id, t, result)
+
+        if result["status"] == "completed":
+            return ThreadUpdate(
+                type=UpdateType.TOOL_COMPLETE,
+                tool_name=tool_call.tool,
+                tool_index=t,
+                result=result
+            )
+        else:
+            return ThreadUpdate(
+                type=UpdateType.ERROR,
+                tool_name=tool_call.tool,
+                tool_index=t,
+                error=result.get("error")
+            )
+        
+    except Exception as e:
+        # capture error
+        sentry_sdk.capture_exception(e)
+        traceback.print_exc()
+
+        # update tool call with status and error
+        await thread.async_update_tool_call(assistant_message.id, t, {
+            "status": "failed",
+            "error": str(e)
+        })
+
+        return ThreadUpdate(
+            type=UpdateType.ERROR,
+            tool_name=tool_call.tool,
+            tool_index=t,
+            error=str(e)
+        )
+
+
+
 async def async_think():
     # - think (gpt3)
     # - choose tools
@@ -226,8 +529,14 @@ async def async_prompt_thread(
     user_messages: Union[UserMessage, List[UserMessage]], 
     tools: Dict[str, Tool],
     force_reply: bool = True,
-    model: Literal[tuple(models)] = "claude-3-5-sonnet-20241022"
+    model: Literal[tuple(models)] = "claude-3-5-sonnet-20241022",
+    stream: bool = False
 ):
+    """
+    Prompt the agent on a thread, yielding ThreadUpdates. With stream, the assistant's text
+    is also yielded as ASSISTANT_TEXT_DELTAs, and each tool call as a TOOL_CALL_START as soon
+    as the model has finished writing it, ahead of the complete ASSISTANT_MESSAGE.
+    """
     
     print("================================================")
     print(user_messages)
@@ -240,167 +549,153 @@ async def async_prompt_thread(
     user_messages = user_messages if isinstance(user_messages, List) else [user_messages]
     user_message_id = user_messages[-1].id
 
-    system_message = Template(template).render(
-        name=agent.name,
-        description=agent.description,
-        instructions=agent.instructions,
+    system_message = agent.get_system_message(
+        system_template,
         system_instructions=system_instructions
     )
 
-    pushes = {"messages": user_messages}
-    
-    agent_mentioned = any(
-        re.search(rf'\b{re.escape(agent.name.lower())}\b', (msg.content or "").lower())
-        for msg in user_messages
-    )
+    # coalesce thread writes, flushing at update boundaries
+    thread.enable_write_buffer(window=THREAD_WRITE_BUFFER_WINDOW)
 
-    if agent_mentioned or force_reply:
-        pushes["active"] = user_message_id
-        thread.push(pushes)
-    else:
-        thread.push(pushes)
-        return
+    try:
+        pushes = {"messages": user_messages}
+    
+        agent_mentioned = any(
+            re.search(rf'\b{re.escape(agent.name.lower())}\b', (msg.content or "").lower())
+            for msg in user_messages
+        )
 
-    # think = True
-    # if think:
-    #     thought = await async_think(thread.messages, tools)
-    #     if not speak, pop active
+        if agent_mentioned or force_reply:
+            pushes["active"] = user_message_id
+            await thread.async_push(pushes)
+        else:
+            await thread.async_push(pushes)
+            return
 
-    yield ThreadUpdate(type=UpdateType.START_PROMPT)
+        # think = True
+        # if think:
+        #     thought = await async_think(thread.messages, tools)
+        #     if not speak, pop active
 
-    while True:
-        try:
-            # for error tracing
-            sentry_sdk.add_breadcrumb(
-                category="prompt",
-                data={"messages": thread.get_messages(), "system_message": system_message, "model": model, "tools": tools.keys()}
-            )
+        yield ThreadUpdate(type=UpdateType.START_PROMPT)
 
-            # main call to LLM            
-            content, tool_calls, stop = await async_prompt(
-                thread.get_messages(), 
-                system_message=system_message,
-                model=model,
-                tools=tools
-            )
+        while True:
+            try:
+                messages = await thread.async_get_messages(model=model)
 
-            # for error tracing
-            sentry_sdk.add_breadcrumb(
-                category="prompt",
-                data={"content": content, "tool_calls": tool_calls, "stop": stop}
-            )
+                # for error tracing
+                sentry_sdk.add_breadcrumb(
+                    category="prompt",
+                    data={"messages": messages, "system_message": system_message, "model": model, "tools": tools.keys()}
+                )
 
-            # create assistant message
-            assistant_message = AssistantMessage(
-                content=content or "",
-                tool_calls=tool_calls,
-                reply_to=user_messages[-1].id
-            )
-            
-            # push assistant message to thread and pop user message from actives array
-            pushes = {"messages": assistant_message}
-            pops = {"active": user_message_id} if stop else {}
-            thread.push(pushes, pops)
-            assistant_message = thread.messages[-1]
-
-            # yield update
-            yield ThreadUpdate(
-                type=UpdateType.ASSISTANT_MESSAGE,
-                message=assistant_message
-            )
+                # main call to LLM
+                if stream:
+                    tool_index = 0
+                    async for event in async_prompt_stream(
+                        messages,
+                        system_message=system_message,
+                        model=model,
+                        tools=tools,
+                        db=db
+                    ):
+                        if isinstance(event, str):
+                            yield ThreadUpdate(type=UpdateType.ASSISTANT_TEXT_DELTA, text=event)
+                        elif isinstance(event, ToolCall):
+                            yield ThreadUpdate(
+                                type=UpdateType.TOOL_CALL_START,
+                                tool_name=event.tool,
+                                tool_index=tool_index,
+                                args=event.args
+                            )
+                            tool_index += 1
+                        else:
+                            content, tool_calls, stop = event
+                else:
+                    content, tool_calls, stop = await async_prompt(
+                        messages, 
+                        system_message=system_message,
+                        model=model,
+                        tools=tools
+                    )
 
-        except Exception as e:
-            # capture error
-            sentry_sdk.capture_exception(e)
-            traceback.print_exc()
+                # for error tracing
+                sentry_sdk.add_breadcrumb(
+                    category="prompt",
+                    data={"content": content, "tool_calls": tool_calls, "stop": stop}
+                )
 
-            # create assistant message
-            assistant_message = AssistantMessage(
-                content="I'm sorry, but something went wrong internally. Please try again later.",
-                reply_to=user_messages[-1].id
-            )
+                # create assistant message
+                assistant_message = AssistantMessage(
+                    content=content or "",
+                    tool_calls=tool_calls,
+                    reply_to=user_messages[-1].id
+                )
             
-            # push assistant message to thread and pop user message from actives array
-            pushes = {"messages": assistant_message}
-            pops = {"active": user_message_id}
-            thread.push(pushes, pops)
+                # push assistant message to thread and pop user message from actives array
+                pushes = {"messages": assistant_message}
+                pops = {"active": user_message_id} if stop else {}
+                await thread.async_push(pushes, pops)
+                assistant_message = thread.messages[-1]
 
-            # yield update
-            yield ThreadUpdate(
-                type=UpdateType.ERROR,
-                message=assistant_message,
-                error=str(e)
-            )
-            
-            # stop thread
-            stop = True
-            break
-        
-        # handle tool calls
-        for t, tool_call in enumerate(assistant_message.tool_calls):
-            try:
-                # get tool
-                tool = tools.get(tool_call.tool)
-                if not tool:
-                    raise Exception(f"Tool {tool_call.tool} not found.")
-
-                # start task
-                task = await tool.async_start_task(
-                    user.id, 
-                    agent.id, 
-                    tool_call.args, 
-                    db=db
+                # yield update
+                yield ThreadUpdate(
+                    type=UpdateType.ASSISTANT_MESSAGE,
+                    message=assistant_message
                 )
 
-                # update tool call with task id and status
-                thread.update_tool_call(assistant_message.id, t, {
-                    "task": ObjectId(task.id),
-                    "status": "pending"
-                })
-                
-                # wait for task to complete
-                result = await tool.async_wait(task)
-                thread.update_tool_call(assistant_message.id, t, result)
-
-                # yield update
-                if result["status"] == "completed":
-                    yield ThreadUpdate(
-                        type=UpdateType.TOOL_COMPLETE,
-                        tool_name=tool_call.tool,
-                        tool_index=t,
-                        result=result
-                    )
-                else:
-                    yield ThreadUpdate(
-                        type=UpdateType.ERROR,
-                        tool_name=tool_call.tool,
-                        tool_index=t,
-                        error=result.get("error")
-                    )
-                
             except Exception as e:
                 # capture error
                 sentry_sdk.capture_exception(e)
                 traceback.print_exc()
 
-                # update tool call with status and error
-                thread.update_tool_call(assistant_message.id, t, {
-                    "status": "failed",
-                    "error": str(e)
-                })
+                # create assistant message
+                assistant_message = AssistantMessage(
+                    content="I'm sorry, but something went wrong internally. Please try again later.",
+                    reply_to=user_messages[-1].id
+                )
+            
+                # push assistant message to thread and pop user message from actives array
+                pushes = {"messages": assistant_message}
+                pops = {"active": user_message_id}
+                await thread.async_push(pushes, pops)
+                await thread.async_flush()
 
                 # yield update
                 yield ThreadUpdate(
                     type=UpdateType.ERROR,
-                    tool_name=tool_call.tool,
-                    tool_index=t,
+                    message=assistant_message,
                     error=str(e)
                 )
-
-        if stop:
-            print("Stopping prompt thread")
-            yield ThreadUpdate(type=UpdateType.UPDATE_COMPLETE)
-            break
+            
+                # stop thread
+                stop = True
+                break
+        
+            # run all tool calls concurrently, yielding updates in the order they complete
+            tool_call_tasks = [
+                asyncio.create_task(async_run_tool_call(
+                    db, user, agent, thread, tools, assistant_message, t, tool_call
+                ))
+                for t, tool_call in enumerate(assistant_message.tool_calls)
+            ]
+            try:
+                for next_update in asyncio.as_completed(tool_call_tasks):
+                    yield await next_update
+            finally:
+                for task in tool_call_tasks:
+                    task.cancel()
+
+            # end of update, persist everything before the next step
+            await thread.async_flush()
+
+            if stop:
+                print("Stopping prompt thread")
+                yield ThreadUpdate(type=UpdateType.UPDATE_COMPLETE)
+                break
+    finally:
+        # also on errors and early closes of the generator, e.g. when the client disconnects
+        await thread.async_disable_write_buffer()
 
 
 def prompt_thread(
@@ -411,9 +706,10 @@ def prompt_thread(
     user_messages: Union[UserMessage, List[UserMessage]], 
     tools: Dict[str, Tool],
     force_reply: bool = False,
-    model: Literal[tuple(models)] = "claude-3-5-sonnet-20241022"
+    model: Literal[tuple(models)] = "claude-3-5-sonnet-20241022",
+    stream: bool = False
 ):
-    async_gen = async_prompt_thread(db, user, agent, thread, user_messages, tools, force_reply, model)
+    async_gen = async_prompt_thread(db, user, agent, thread, user_messages, tools, force_reply, model, stream)
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
@@ -436,9 +732,11 @@ async def async_title_thread(thread: Thread, *extra_messages: UserMessage):
         title: str = Field(description="a phrase of 2-5 words (or up to 30 characters) that conveys the subject of the chat thread. It should be concise and terse, and not include any special characters or punctuation.")
 
     system_message = "You are an expert at creating concise titles for chat threads."
-    messages = thread.get_messages()
-    messages.extend(extra_messages)
-    messages.append(UserMessage(content="Come up with a title for this thread."))
+    messages = [
+        *await thread.async_get_messages(model="gpt-4o-mini"),
+        *extra_messages,
+        UserMessage(content="Come up with a title for this thread.")
+    ]
 
     try:
         result = await async_prompt(
@@ -448,7 +746,7 @@ async def async_title_thread(thread: Thread, *extra_messages: UserMessage):
             response_model=TitleResponse,
         )
         thread.title = result.title
-        thread.save()
+        await thread.async_save()
 
     except Exception as e:
         sentry_sdk.capture_exception(e)
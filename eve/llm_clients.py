@@ -0,0 +1,76 @@
+import os
+import httpx
+import asyncio
+import weakref
+import threading
+import openai
+import anthropic
+
+from .eden_utils import HTTP2
+
+
+# connection pool size of each pooled llm client
+LLM_MAX_CONNECTIONS = int(os.getenv("EDEN_LLM_MAX_CONNECTIONS", 64))
+
+LLM_CONNECTION_LIMITS = httpx.Limits(
+    max_connections=LLM_MAX_CONNECTIONS,
+    max_keepalive_connections=LLM_MAX_CONNECTIONS,
+    keepalive_expiry=120,
+)
+
+# pooled sync llm clients of this process, by provider
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+
+# pooled async llm clients, one set per event loop
+_async_llm_clients = weakref.WeakKeyDictionary()
+
+
+def _reset_llm_clients():
+    """
+    Drop all pooled llm clients, so a forked child never reuses its parent's connections.
+    """
+    global _llm_clients_lock
+    _llm_clients_lock = threading.Lock()
+    _llm_clients.clear()
+    _async_llm_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_llm_clients)
+
+
+def get_openai_client() -> openai.OpenAI:
+    """
+    Get the pooled sync OpenAI client, creating it lazily on first use in this process.
+    """
+    with _llm_clients_lock:
+        if "openai" not in _llm_clients:
+            _llm_clients["openai"] = openai.OpenAI(
+                http_client=openai.DefaultHttpxClient(http2=HTTP2, limits=LLM_CONNECTION_LIMITS)
+            )
+        return _llm_clients["openai"]
+
+
+def get_async_anthropic_client() -> anthropic.AsyncAnthropic:
+    """
+    Get the pooled async Anthropic client of the running event loop.
+    """
+    clients = _async_llm_clients.setdefault(asyncio.get_running_loop(), {})
+    if "anthropic" not in clients:
+        clients["anthropic"] = anthropic.AsyncAnthropic(
+            http_client=anthropic.DefaultAsyncHttpxClient(http2=HTTP2, limits=LLM_CONNECTION_LIMITS)
+        )
+    return clients["anthropic"]
+
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """
+    Get the pooled async OpenAI client of the running event loop.
+    """
+    clients = _async_llm_clients.setdefault(asyncio.get_running_loop(), {})
+    if "openai" not in clients:
+        clients["openai"] = openai.AsyncOpenAI(
+            http_client=openai.DefaultAsyncHttpxClient(http2=HTTP2, limits=LLM_CONNECTION_LIMITS)
+        )
+    return clients["openai"]
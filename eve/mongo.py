@@ -1,8 +1,13 @@
 import os
 import copy
 import yaml
-from pydantic import BaseModel, Field, ConfigDict, ValidationError
-from pymongo import MongoClient
+import asyncio
+import threading
+import weakref
+import traceback
+from pydantic import BaseModel, Field, ConfigDict, ValidationError, PrivateAttr, TypeAdapter
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, WriteError
 from datetime import datetime, timezone
 from bson import ObjectId
 from typing import Optional
@@ -10,7 +15,8 @@ from typing import Optional
 from pydantic import BaseModel, Field, ValidationError
 from pymongo import MongoClient
 from bson import ObjectId
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, Union, get_origin, get_args
+from motor.motor_asyncio import AsyncIOMotorClient
 
 
 MONGO_URI = os.getenv("MONGO_URI")
@@ -26,10 +32,314 @@ if not all([MONGO_URI, MONGO_DB_NAME_STAGE, MONGO_DB_NAME_PROD]):
     # raise ValueError("MONGO_URI, MONGO_DB_NAME_STAGE, and MONGO_DB_NAME_PROD must be set in the environment")
     print("WARNING: MONGO_URI, MONGO_DB_NAME_STAGE, and MONGO_DB_NAME_PROD must be set in the environment")
 
+# connection pool settings, shared by every client in the registry
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+
+# process-wide registries, keyed by (uri, db_name) and (uri, db_name, collection_name)
+_mongo_clients = {}
+_mongo_collections = {}
+_mongo_lock = threading.Lock()
+
+# motor clients are bound to the event loop they were first used on, so keep one registry per loop
+_async_mongo_clients = weakref.WeakKeyDictionary()
+
+
+def _reset_mongo_clients():
+    """
+    Drop all pooled clients. MongoClient is not fork-safe, so a forked child 
+    must never reuse sockets inherited from its parent.
+    """
+    global _mongo_lock
+    _mongo_lock = threading.Lock()
+    _mongo_clients.clear()
+    _mongo_collections.clear()
+    _async_mongo_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_mongo_clients)
+
+
+def get_mongo_client(db: str, uri: str = None):
+    """
+    Get the pooled MongoClient for a db, creating it lazily on first use in this process.
+    """
+    uri = uri or MONGO_URI
+    key = (uri, db_names[db])
+    client = _mongo_clients.get(key)
+    if client is None:
+        with _mongo_lock:
+            client = _mongo_clients.get(key)
+            if client is None:
+                client = MongoClient(
+                    uri,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                    connect=False,
+                )
+                _mongo_clients[key] = client
+    return client
+
+
 def get_collection(collection_name: str, db: str):
-    mongo_client = MongoClient(MONGO_URI)
     db_name = db_names[db]
-    return mongo_client[db_name][collection_name]
+    key = (MONGO_URI, db_name, collection_name)
+    collection = _mongo_collections.get(key)
+    if collection is None:
+        mongo_client = get_mongo_client(db)
+        collection = mongo_client[db_name][collection_name]
+        _mongo_collections[key] = collection
+    return collection
+
+
+def get_async_collection(collection_name: str, db: str):
+    """
+    Get a Motor collection for the running event loop, sharing one pooled client per (uri, db) per loop.
+    """
+    loop = asyncio.get_running_loop()
+    db_name = db_names[db]
+    registry = _async_mongo_clients.setdefault(loop, {})
+    key = (MONGO_URI, db_name)
+    client = registry.get(key)
+    if client is None:
+        client = AsyncIOMotorClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            io_loop=loop,
+        )
+        registry[key] = client
+    return client[db_name][collection_name]
+
+
+def close_mongo_clients():
+    """
+    Close all pooled clients, e.g. on application shutdown.
+    """
+    with _mongo_lock:
+        for client in _mongo_clients.values():
+            client.close()
+        for registry in _async_mongo_clients.values():
+            for client in registry.values():
+                client.close()
+    _reset_mongo_clients()
+
+class WriteBuffer:
+    """
+    Write-behind buffer for granular document updates.
+
+    Consecutive $set, $push and $pull operations on the same document are coalesced 
+    into a single update as long as their paths do not conflict, and everything pending
+    for a collection is sent in one bulk_write on flush. If a window (in seconds) is given
+    and an event loop is running, pending writes are flushed automatically that long 
+    after the first buffered write.
+    """
+
+    def __init__(self, window: Optional[float] = None):
+        self.window = window
+        self._pending = {}
+        self._timer = None
+        self._flush_task = None
+        self._flush_lock = None
+
+    def __deepcopy__(self, memo):
+        # buffers are shared, never copied along with the documents using them
+        return self
+
+    def __len__(self):
+        return sum(len(ops) for _, ops in self._pending.values())
+
+    def add(self, document_cls, db: str, filter: dict, update: dict, array_filters: Optional[List[dict]] = None):
+        """
+        Buffer an update, merging it into the last pending update for the same document when possible.
+        """
+        collection_name = getattr(document_cls, "collection_name", document_cls.__name__.lower())
+        _, ops = self._pending.setdefault((collection_name, db), (document_cls, []))
+        # only merge into the last queued op, merging past an op on another document would reorder writes
+        last_op = ops[-1] if ops and ops[-1]["filter"] == filter else None
+        if last_op and _can_merge_update(last_op, update, array_filters):
+            _merge_update(last_op, update, array_filters)
+        else:
+            ops.append({
+                "filter": filter,
+                "update": copy.deepcopy(update),
+                "array_filters": list(array_filters or []),
+            })
+        self._schedule_flush()
+
+    def flush(self):
+        """
+        Send all pending updates to MongoDB. Updates that were not written are kept for the next flush.
+        """
+        self._cancel_timer()
+        pending, self._pending = list(self._pending.items()), {}
+        for i, ((_, db), (document_cls, ops)) in enumerate(pending):
+            collection = document_cls.get_collection(db)
+            try:
+                if len(ops) == 1:
+                    op = ops[0]
+                    collection.update_one(op["filter"], op["update"], array_filters=op["array_filters"] or None)
+                else:
+                    collection.bulk_write(_to_bulk_operations(ops), ordered=True)
+            except Exception as e:
+                self._restore(pending[i:], e)
+                raise
+
+    async def async_flush(self):
+        """
+        Async version of flush. Flushes never overlap, so buffered updates reach MongoDB in order.
+        """
+        self._cancel_timer()
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending, self._pending = list(self._pending.items()), {}
+            for i, ((_, db), (document_cls, ops)) in enumerate(pending):
+                collection = document_cls.async_get_collection(db)
+                try:
+                    if len(ops) == 1:
+                        op = ops[0]
+                        await collection.update_one(op["filter"], op["update"], array_filters=op["array_filters"] or None)
+                    else:
+                        await collection.bulk_write(_to_bulk_operations(ops), ordered=True)
+                except Exception as e:
+                    self._restore(pending[i:], e)
+                    raise
+
+    def _restore(self, unsent: list, error: Exception):
+        """
+        Put the updates of a failed flush back in front of those buffered since, so they are retried in order.
+        An update MongoDB rejected is dropped, retrying it would only fail again.
+        """
+        (key, (document_cls, ops)), unsent = unsent[0], unsent[1:]
+        if isinstance(error, BulkWriteError) and error.details.get("writeErrors"):
+            # an ordered bulk write stops at its first rejected update, those before it were applied
+            ops = ops[error.details["writeErrors"][0]["index"] + 1:]
+        elif isinstance(error, WriteError):
+            ops = []
+        pending = {key: (document_cls, list(ops))}
+        pending.update((key, (document_cls, list(ops))) for key, (document_cls, ops) in unsent)
+        for key, (document_cls, ops) in self._pending.items():
+            pending.setdefault(key, (document_cls, []))[1].extend(ops)
+        self._pending = {key: value for key, value in pending.items() if value[1]}
+
+    def _schedule_flush(self):
+        if self.window is None or self._timer is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(self.window, self._on_timer)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        self._timer = None
+        self._flush_task = asyncio.ensure_future(self._timed_flush())
+
+    async def _timed_flush(self):
+        try:
+            await self.async_flush()
+        except Exception:
+            print(traceback.format_exc())
+
+
+def _update_paths(update: dict):
+    return [
+        (operator, path) 
+        for operator, fields in update.items() if operator != "$currentDate"
+        for path in fields
+    ]
+
+
+def _paths_overlap(path1: str, path2: str):
+    return path1 == path2 or path1.startswith(path2 + ".") or path2.startswith(path1 + ".")
+
+
+def _can_merge_update(op: dict, update: dict, array_filters: Optional[List[dict]] = None):
+    """
+    Two updates can be merged if applying them together is equivalent to applying them in sequence.
+    """
+    for operator, path in _update_paths(update):
+        for existing_operator, existing_path in _update_paths(op["update"]):
+            if not _paths_overlap(path, existing_path):
+                continue
+            # later $set wins and consecutive $push extend, anything else must stay ordered
+            if path != existing_path or operator != existing_operator or operator not in ("$set", "$push"):
+                return False
+    existing_filters = {next(iter(f)).split(".")[0]: f for f in op["array_filters"]}
+    for array_filter in array_filters or []:
+        identifier = next(iter(array_filter)).split(".")[0]
+        if identifier in existing_filters and existing_filters[identifier] != array_filter:
+            return False
+    return True
+
+
+def _merge_update(op: dict, update: dict, array_filters: Optional[List[dict]] = None):
+    for operator, fields in update.items():
+        existing_fields = op["update"].setdefault(operator, {})
+        for path, value in fields.items():
+            if operator == "$push" and path in existing_fields:
+                existing_fields[path]["$each"].extend(copy.deepcopy(value["$each"]))
+            else:
+                existing_fields[path] = copy.deepcopy(value)
+    for array_filter in array_filters or []:
+        if array_filter not in op["array_filters"]:
+            op["array_filters"].append(array_filter)
+
+
+def _to_bulk_operations(ops: List[dict]):
+    return [
+        UpdateOne(op["filter"], op["update"], array_filters=op["array_filters"] or None)
+        for op in ops
+    ]
+
+
+# cached TypeAdapters for the items of list fields, keyed by (document class, field name)
+_item_type_adapters = {}
+
+
+def _get_item_type_adapter(document_cls, field_name: str) -> Optional[TypeAdapter]:
+    """
+    Get a TypeAdapter validating single items of a list field, or None if it is not a list field.
+    """
+    key = (document_cls, field_name)
+    if key not in _item_type_adapters:
+        field = document_cls.model_fields.get(field_name)
+        item_type = _get_list_item_type(field.annotation) if field else None
+        item_adapter = None
+        if item_type is not None:
+            # models carry their own config, everything else may be an arbitrary type like ObjectId
+            is_model = isinstance(item_type, type) and issubclass(item_type, BaseModel)
+            config = None if is_model else ConfigDict(arbitrary_types_allowed=True)
+            item_adapter = TypeAdapter(item_type, config=config)
+        _item_type_adapters[key] = item_adapter
+    return _item_type_adapters[key]
+
+
+def _get_list_item_type(annotation):
+    if get_origin(annotation) is Union:
+        for arg in get_args(annotation):
+            item_type = _get_list_item_type(arg)
+            if item_type is not None:
+                return item_type
+        return None
+    if get_origin(annotation) is list:
+        args = get_args(annotation)
+        return args[0] if args else Any
+    return None
+
 
 def Collection(name):
     def wrapper(cls):
@@ -44,6 +354,8 @@ class Document(BaseModel):
     updatedAt: Optional[datetime] = None
     db: Optional[str] = None
 
+    _write_buffer: Optional[WriteBuffer] = PrivateAttr(default=None)
+
     model_config = ConfigDict(
         json_encoders={
             ObjectId: str,
@@ -62,6 +374,15 @@ class Document(BaseModel):
         collection_name = getattr(cls, "collection_name", cls.__name__.lower())
         return get_collection(collection_name, db)
 
+    @classmethod
+    def async_get_collection(cls, db=None):
+        """
+        Motor (async) counterpart of get_collection.
+        """
+        db = db or cls.db or "STAGE"
+        collection_name = getattr(cls, "collection_name", cls.__name__.lower())
+        return get_async_collection(collection_name, db)
+
     @classmethod
     def from_schema(cls, schema: dict, db="STAGE", from_yaml=True):
         schema["db"] = db
@@ -90,9 +411,18 @@ class Document(BaseModel):
         schema = cls.get_collection(db).find_one({"_id": document_id})
         if not schema:
             raise ValueError(f"Document {document_id} not found in {cls.collection_name}:{db}")        
-        sub_cls = cls.get_sub_class(schema, from_yaml=False, db=db)
-        schema = sub_cls.convert_from_mongo(schema, db=db)
-        return cls.from_schema(schema, db, from_yaml=False)
+        return cls._from_mongo_schema(schema, db)
+
+    @classmethod
+    async def async_from_mongo(cls, document_id: ObjectId, db="STAGE"):
+        """
+        Async version of from_mongo.
+        """
+        document_id = document_id if isinstance(document_id, ObjectId) else ObjectId(document_id)
+        schema = await cls.async_get_collection(db).find_one({"_id": document_id})
+        if not schema:
+            raise ValueError(f"Document {document_id} not found in {cls.collection_name}:{db}")
+        return cls._from_mongo_schema(schema, db)
         
     @classmethod
     def load(cls, db="STAGE", **kwargs):
@@ -102,6 +432,20 @@ class Document(BaseModel):
         schema = cls.get_collection(db).find_one(kwargs)
         if not schema:
             raise MongoDocumentNotFound(cls.collection_name, db, **kwargs)
+        return cls._from_mongo_schema(schema, db)
+
+    @classmethod
+    async def async_load(cls, db="STAGE", **kwargs):
+        """
+        Async version of load.
+        """
+        schema = await cls.async_get_collection(db).find_one(kwargs)
+        if not schema:
+            raise MongoDocumentNotFound(cls.collection_name, db, **kwargs)
+        return cls._from_mongo_schema(schema, db)
+
+    @classmethod
+    def _from_mongo_schema(cls, schema: dict, db="STAGE"):
         sub_cls = cls.get_sub_class(schema, from_yaml=False, db=db)
         schema = sub_cls.convert_from_mongo(schema, db=db)
         return cls.from_schema(schema, db, from_yaml=False)
@@ -131,31 +475,45 @@ class Document(BaseModel):
         Save the current state of the model to the database.
         """
         db = db or self.db or "STAGE"        
-        
+        self.flush()
+        filter, schema = self._prepare_save(upsert_filter, **kwargs)
+        result = self.get_collection(db).find_one_and_replace(
+            filter,
+            schema,
+            upsert=True,
+            return_document=True  # Returns the document after changes
+        )
+        self.id = result["_id"]            
+        self.db = db
+
+    async def async_save(self, db=None, upsert_filter=None, **kwargs):
+        """
+        Async version of save.
+        """
+        db = db or self.db or "STAGE"
+        await self.async_flush()
+        filter, schema = self._prepare_save(upsert_filter, **kwargs)
+        result = await self.async_get_collection(db).find_one_and_replace(
+            filter,
+            schema,
+            upsert=True,
+            return_document=True
+        )
+        self.id = result["_id"]
+        self.db = db
+
+    def _prepare_save(self, upsert_filter=None, **kwargs):
+        """
+        Validate and convert the model into an upsert filter and a replacement document.
+        """
         schema = self.model_dump(by_alias=True, exclude={"db"})
         self.model_validate(schema)
         schema = self.convert_to_mongo(schema)
         schema.update(kwargs)
         self.updatedAt = datetime.now(timezone.utc)
-        
         filter = upsert_filter or {"_id": self.id or ObjectId()}
-        collection = self.get_collection(db)
-        if self.id or filter:
-            if filter:
-                schema.pop("_id", None)
-            result = collection.find_one_and_replace(
-                filter,
-                schema,
-                upsert=True,
-                return_document=True  # Returns the document after changes
-            )
-            self.id = result["_id"]            
-        else:
-            schema["_id"] = ObjectId()
-            self.createdAt = datetime.now(timezone.utc)
-            result = collection.insert_one(schema)
-            self.id = schema["_id"]
-        self.db = db
+        schema.pop("_id", None)
+        return filter, schema
 
     @classmethod
     def save_many(cls, documents: List[BaseModel], db=None):
@@ -174,29 +532,82 @@ class Document(BaseModel):
         """
         Perform granular updates on specific fields.
         """        
+        update_ops = {
+            "$set": kwargs,
+            "$currentDate": {"updatedAt": True}
+        }
+        if self._buffer_update({"_id": self.id}, update_ops):
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            return
         collection = self.get_collection(self.db)
-        update_result = collection.update_one(
-            {"_id": self.id}, 
-            {
-                "$set": kwargs,
-                "$currentDate": {"updatedAt": True}
-            }
-        )
+        update_result = collection.update_one({"_id": self.id}, update_ops)
         if update_result.modified_count > 0:
             for key, value in kwargs.items():
                 setattr(self, key, value)
 
-    def set_against_filter(self, updates: Dict = None, filter: Optional[Dict] = None):
+    async def async_update(self, **kwargs):
+        """
+        Async version of update.
+        """
+        update_ops = {
+            "$set": kwargs,
+            "$currentDate": {"updatedAt": True}
+        }
+        if self._buffer_update({"_id": self.id}, update_ops):
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+            return
+        collection = self.async_get_collection(self.db)
+        update_result = await collection.update_one({"_id": self.id}, update_ops)
+        if update_result.modified_count > 0:
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    def set_against_filter(
+        self, 
+        updates: Dict = None, 
+        filter: Optional[Dict] = None, 
+        array_filters: Optional[List[Dict]] = None
+    ):
         """
         Perform granular updates on specific fields, given an optional filter.
         """
+        update_ops = {
+            "$set": updates,
+            "$currentDate": {"updatedAt": True}
+        }
+        if self._buffer_update({"_id": self.id, **(filter or {})}, update_ops, array_filters):
+            return
         collection = self.get_collection(self.db)
         update_result = collection.update_one(
-            {"_id": self.id, **filter},
-            {
-                "$set": updates,
-                "$currentDate": {"updatedAt": True}
-            }
+            {"_id": self.id, **(filter or {})},
+            update_ops,
+            array_filters=array_filters
+        )
+        if update_result.modified_count > 0:
+            self.updatedAt = datetime.now(timezone.utc)
+
+    async def async_set_against_filter(
+        self, 
+        updates: Dict = None, 
+        filter: Optional[Dict] = None, 
+        array_filters: Optional[List[Dict]] = None
+    ):
+        """
+        Async version of set_against_filter.
+        """
+        update_ops = {
+            "$set": updates,
+            "$currentDate": {"updatedAt": True}
+        }
+        if self._buffer_update({"_id": self.id, **(filter or {})}, update_ops, array_filters):
+            return
+        collection = self.async_get_collection(self.db)
+        update_result = await collection.update_one(
+            {"_id": self.id, **(filter or {})},
+            update_ops,
+            array_filters=array_filters
         )
         if update_result.modified_count > 0:
             self.updatedAt = datetime.now(timezone.utc)
@@ -209,24 +620,105 @@ class Document(BaseModel):
         """
         Push or pull values granularly to array fields in document.
         """
+        update_ops = self._prepare_push(pushes, pulls)
+        if self._buffer_update({"_id": self.id}, update_ops):
+            return
+        collection = self.get_collection(self.db)
+        update_result = collection.update_one(
+            {"_id": self.id},
+            update_ops
+        )
+        if update_result.modified_count > 0:
+            self.updatedAt = datetime.now(timezone.utc)
+
+    async def async_push(
+        self,
+        pushes: Dict[str, Union[Any, List[Any]]] = {},
+        pulls: Dict[str, Any] = {}
+    ):
+        """
+        Async version of push.
+        """
+        update_ops = self._prepare_push(pushes, pulls)
+        if self._buffer_update({"_id": self.id}, update_ops):
+            return
+        collection = self.async_get_collection(self.db)
+        update_result = await collection.update_one(
+            {"_id": self.id},
+            update_ops
+        )
+        if update_result.modified_count > 0:
+            self.updatedAt = datetime.now(timezone.utc)
+
+    def enable_write_buffer(self, window: Optional[float] = None, buffer: Optional[WriteBuffer] = None) -> WriteBuffer:
+        """
+        Route granular updates (update, set_against_filter, push) through a write-behind buffer 
+        until flushed. Pass the same buffer to several documents to batch their writes together.
+        """
+        self._write_buffer = buffer or self._write_buffer or WriteBuffer(window=window)
+        return self._write_buffer
+
+    def disable_write_buffer(self):
+        """
+        Flush any pending writes and go back to writing through immediately.
+        """
+        self.flush()
+        self._write_buffer = None
+
+    async def async_disable_write_buffer(self):
+        """
+        Async version of disable_write_buffer.
+        """
+        await self.async_flush()
+        self._write_buffer = None
+
+    def flush(self):
+        """
+        Send any buffered writes to the database.
+        """
+        if self._write_buffer is not None:
+            self._write_buffer.flush()
+
+    async def async_flush(self):
+        """
+        Async version of flush.
+        """
+        if self._write_buffer is not None:
+            await self._write_buffer.async_flush()
+
+    def _buffer_update(self, filter: dict, update: dict, array_filters: Optional[List[dict]] = None) -> bool:
+        if self._write_buffer is None:
+            return False
+        self._write_buffer.add(type(self), self.db, filter, update, array_filters)
+        self.updatedAt = datetime.now(timezone.utc)
+        return True
+
+    def _prepare_push(
+        self,
+        pushes: Dict[str, Union[Any, List[Any]]] = {},
+        pulls: Dict[str, Any] = {}
+    ) -> dict:
+        """
+        Apply pushes and pulls to the local instance and return the matching MongoDB update operation.
+        """
         push_ops, pull_ops = {}, {}
         for field_name, value in pushes.items():
             values_to_push = value if isinstance(value, list) else [value]
 
+            # Validate only the new items against the item type of the field
+            item_adapter = _get_item_type_adapter(type(self), field_name)
+            if item_adapter is not None:
+                values_to_push = [item_adapter.validate_python(v) for v in values_to_push]
+
             # Convert Pydantic models to dictionaries if needed
-            values_original = [copy.deepcopy(v) for v in values_to_push]
-            values_to_push = [v.model_dump() if isinstance(v, BaseModel) else v for v in values_to_push]
-            
-            # Create a copy of the current instance and update the array field with the new values for validation
-            updated_data = copy.deepcopy(self)
-            if hasattr(updated_data, field_name) and isinstance(getattr(updated_data, field_name), list):
-                getattr(updated_data, field_name).extend(values_original)
-            
-            push_ops[field_name] = {"$each": values_to_push}
-
-            # Set field values in local instance
-            if hasattr(self, field_name) and isinstance(getattr(self, field_name), list):
-                setattr(self, field_name, getattr(self, field_name) + values_original)
+            push_ops[field_name] = {
+                "$each": [v.model_dump() if isinstance(v, BaseModel) else v for v in values_to_push]
+            }
+
+            # Append field values to local instance, without copying the existing list
+            current_list = getattr(self, field_name, None)
+            if isinstance(current_list, list):
+                current_list.extend(values_to_push)
 
         # Do same thing for pulls
         for field_name, value in pulls.items():
@@ -238,19 +730,13 @@ class Document(BaseModel):
                 setattr(self, field_name, [x for x in current_list if x != value])
 
         # Update MongoDB operation to use $pull instead of $pop
-        collection = self.get_collection(self.db)
         update_ops = {"$currentDate": {"updatedAt": True}}
         if push_ops:
             update_ops["$push"] = push_ops
         if pull_ops:
             update_ops["$pull"] = pull_ops
 
-        update_result = collection.update_one(
-            {"_id": self.id},
-            update_ops
-        )
-        if update_result.modified_count > 0:
-            self.updatedAt = datetime.now(timezone.utc)
+        return update_ops
 
     def update_nested_field(self, field_name: str, index: int, sub_field: str, value):
         """
@@ -289,11 +775,22 @@ class Document(BaseModel):
         """
         Reload the current document from the database to ensure the instance is up-to-date.
         """
+        self.flush()
         updated_instance = self.from_mongo(self.id, self.db)
         if updated_instance:
             # Use model_dump to get the data while maintaining type information
             for key, value in updated_instance.model_dump().items():
                 setattr(self, key, value)
+
+    async def async_reload(self):
+        """
+        Async version of reload.
+        """
+        await self.async_flush()
+        updated_instance = await self.async_from_mongo(self.id, self.db)
+        if updated_instance:
+            for key, value in updated_instance.model_dump().items():
+                setattr(self, key, value)
         
 
     def delete(self):
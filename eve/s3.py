@@ -1,14 +1,24 @@
 import os
 import io
 import os
+import mmap
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import hashlib
 import mimetypes
 import magic
 import requests
 import tempfile
+import threading
+import asyncio
+import weakref
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 from pydub import AudioSegment
 from typing import Iterator
+from urllib.parse import urlparse
 from PIL import Image
 
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
@@ -25,9 +35,113 @@ s3 = boto3.client(
     's3', 
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION_NAME
+    region_name=AWS_REGION_NAME,
+    # one pooled client is shared by concurrent uploads
+    config=Config(max_pool_connections=int(os.getenv("AWS_S3_MAX_POOL_CONNECTIONS", 32)))
 )
 
+# files larger than this are uploaded in streaming mode, without reading them into memory
+STREAMING_UPLOAD_THRESHOLD = int(os.getenv("AWS_S3_STREAMING_UPLOAD_THRESHOLD", 32 * 1024**2))
+
+# multipart uploads of large files, sent in concurrent parts
+transfer_config = TransferConfig(
+    multipart_threshold=STREAMING_UPLOAD_THRESHOLD,
+    multipart_chunksize=int(os.getenv("AWS_S3_MULTIPART_CHUNKSIZE", 16 * 1024**2)),
+    max_concurrency=int(os.getenv("AWS_S3_MULTIPART_CONCURRENCY", 8)),
+)
+
+# seconds an object is trusted to exist in the known-object index
+KNOWN_OBJECT_TTL = int(os.getenv("AWS_S3_KNOWN_OBJECT_TTL", 24 * 3600))
+
+# also share the known-object index across processes through MongoDB
+KNOWN_OBJECT_SHARED = os.getenv("AWS_S3_KNOWN_OBJECT_SHARED", "false").lower() == "true"
+
+
+class KnownObjectIndex:
+    """
+    Index of objects known to exist, keyed by (bucket, key), so uploads of content-addressed 
+    objects can skip both the HEAD and the PUT. Entries expire after ttl seconds. The local 
+    index is an LRU of max_items, optionally backed by a shared MongoDB collection with a TTL index.
+    """
+
+    collection_name = "s3_objects"
+
+    def __init__(self, ttl=KNOWN_OBJECT_TTL, max_items=100000, shared=KNOWN_OBJECT_SHARED):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._indexed_dbs = set()
+        self._lock = threading.Lock()
+
+    def contains(self, bucket, key, db="STAGE"):
+        now = time.monotonic()
+        with self._lock:
+            expiry = self._items.get((bucket, key))
+            if expiry is not None and expiry > now:
+                self._items.move_to_end((bucket, key))
+                self.hits += 1
+                return True
+        if self.shared and self._shared_contains(bucket, key, db):
+            self._add_local(bucket, key)
+            with self._lock:
+                self.shared_hits += 1
+            return True
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def add(self, bucket, key, db="STAGE"):
+        self._add_local(bucket, key)
+        if self.shared:
+            try:
+                self._get_collection(db).update_one(
+                    {"_id": f"{bucket}/{key}"},
+                    {"$set": {"createdAt": datetime.now(timezone.utc)}},
+                    upsert=True
+                )
+            except Exception as e:
+                print(f"Failed to update shared known-object index: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "shared_hits": self.shared_hits, "misses": self.misses, "size": len(self._items)}
+
+    def _add_local(self, bucket, key):
+        with self._lock:
+            self._items[(bucket, key)] = time.monotonic() + self.ttl
+            self._items.move_to_end((bucket, key))
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _shared_contains(self, bucket, key, db):
+        try:
+            return self._get_collection(db).find_one({"_id": f"{bucket}/{key}"}, {"_id": 1}) is not None
+        except Exception as e:
+            print(f"Failed to query shared known-object index: {e}")
+            return False
+
+    def _get_collection(self, db):
+        from .mongo import get_collection
+
+        collection = get_collection(self.collection_name, db)
+        if db not in self._indexed_dbs:
+            collection.create_index("createdAt", expireAfterSeconds=self.ttl)
+            self._indexed_dbs.add(db)
+        return collection
+
+
+known_objects = KnownObjectIndex()
+
+# maximum number of concurrent uploads from async code, per event loop
+ASYNC_UPLOAD_CONCURRENCY = int(os.getenv("AWS_S3_ASYNC_UPLOAD_CONCURRENCY", 16))
+
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
 s3_buckets = {
     "STAGE": AWS_BUCKET_NAME_STAGE,
     "PROD": AWS_BUCKET_NAME_PROD,
@@ -53,6 +167,20 @@ def get_root_url(db="STAGE"):
     return f"https://{bucket_name}.s3.{AWS_REGION_NAME}.amazonaws.com"
 
 
+def parse_bucket_url(url):
+    """
+    Returns the (bucket, key) of a url in one of our buckets, or None.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "https" or not parsed.netloc.endswith(".amazonaws.com"):
+        return None
+    bucket = parsed.netloc.split(".s3.")[0]
+    key = parsed.path.lstrip("/")
+    if bucket not in s3_buckets.values() or not key:
+        return None
+    return bucket, key
+
+
 def upload_file_from_url(url, name=None, file_type=None, db="STAGE"):
     """Uploads a file to an S3 bucket by downloading it to a temporary file and uploading it to S3."""
 
@@ -61,6 +189,13 @@ def upload_file_from_url(url, name=None, file_type=None, db="STAGE"):
         filename = url.split("/")[-1].split(".")[0]
         return url, filename
 
+    # files in our other buckets are copied server-side
+    source = parse_bucket_url(url)
+    if source and not name and file_type in [None, os.path.splitext(source[1])[1]]:
+        source_bucket, key = source
+        file_url = copy_file_to_bucket(source_bucket, s3_buckets[db], key)
+        return file_url, os.path.splitext(key)[0]
+
     with requests.get(url, stream=True) as r:
         r.raise_for_status()
         with tempfile.NamedTemporaryFile() as tmp_file:
@@ -80,14 +215,68 @@ def upload_file(file_path, name=None, file_type=None, db="STAGE"):
     if file_path.startswith('http://') or file_path.startswith('https://'):
         return upload_file_from_url(file_path, name, file_type, db)
     
+    if os.path.getsize(file_path) > STREAMING_UPLOAD_THRESHOLD:
+        return upload_file_streaming(file_path, name, file_type, db)
+
     with open(file_path, 'rb') as file:
         buffer = file.read()
 
     return upload_buffer(buffer, name, file_type, db)    
 
 
-def upload_buffer(buffer, name=None, file_type=None, db="STAGE"):
-    """Uploads a buffer to an S3 bucket and returns the file URL."""
+def upload_file_streaming(file_path, name=None, file_type=None, db="STAGE"):
+    """
+    Uploads a file to an S3 bucket without reading it into memory, and returns the file URL.
+    The mime type is sniffed from the head of the file, the file is hashed in chunks through mmap, 
+    and uploaded in concurrent multipart chunks. Images needing conversion are uploaded from a buffer.
+    """
+
+    with open(file_path, 'rb') as file:
+        mime_type = magic.from_buffer(file.read(8192), mime=True)
+        originial_file_type = file_extensions.get(mime_type) or mimetypes.guess_extension(mime_type) or f".{mime_type.split('/')[-1]}"
+        if not file_type:
+            file_type = originial_file_type
+
+        if file_type != originial_file_type and mime_type.startswith('image/'):
+            file.seek(0)
+            return upload_buffer(file.read(), name, file_type, db)
+
+        # if no name is provided, use sha256 of content
+        if not name:
+            hasher = hashlib.sha256()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                for i in range(0, len(view), transfer_config.multipart_chunksize):
+                    hasher.update(view[i:i + transfer_config.multipart_chunksize])
+            name = hasher.hexdigest()
+
+    filename = f"{name}{file_type}"
+    bucket_name = s3_buckets[db]
+    file_url = f"https://{bucket_name}.s3.amazonaws.com/{filename}"
+
+    if known_objects.contains(bucket_name, filename, db):
+        return file_url, name
+
+    # if file doesn't exist, upload it
+    try:
+        s3.head_object(Bucket=bucket_name, Key=filename)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] == '404':
+            s3.upload_file(
+                file_path,
+                bucket_name,
+                filename,
+                ExtraArgs={'ContentType': mime_type, 'ContentDisposition': 'inline'},
+                Config=transfer_config,
+            )
+        else:
+            raise e
+
+    known_objects.add(bucket_name, filename, db)
+    return file_url, name
+
+
+def upload_buffer(buffer, name=None, file_type=None, db="STAGE", mime_type=None):
+    """Uploads a buffer to an S3 bucket and returns the file URL. The mime type is sniffed unless given."""
     
     assert file_type in [None, '.jpg', '.webp', '.png', '.mp3', '.mp4', '.flac', '.wav', '.tar', '.zip', '.safetensors'], \
         "file_type must be one of ['.jpg', '.webp', '.png', '.mp3', '.mp4', '.flac', '.wav', '.tar', '.zip', '.safetensors']"
@@ -98,7 +287,7 @@ def upload_buffer(buffer, name=None, file_type=None, db="STAGE"):
     #print(f"Uploading file to S3: {name}{file_type}")
 
     # Get file extension from mimetype
-    mime_type = magic.from_buffer(buffer, mime=True)
+    mime_type = mime_type or magic.from_buffer(buffer, mime=True)
     originial_file_type = file_extensions.get(mime_type) or mimetypes.guess_extension(mime_type) or f".{mime_type.split('/')[-1]}"
     if not file_type:
         file_type = originial_file_type
@@ -129,11 +318,13 @@ def upload_buffer(buffer, name=None, file_type=None, db="STAGE"):
     file_bytes = io.BytesIO(buffer)
     bucket_name = s3_buckets[db]
     file_url = f"https://{bucket_name}.s3.amazonaws.com/{filename}"
+
+    if known_objects.contains(bucket_name, filename, db):
+        return file_url, name
     
     # if file doesn't exist, upload it
     try:
         s3.head_object(Bucket=bucket_name, Key=filename)
-        return file_url, name
     except s3.exceptions.ClientError as e:
         if e.response['Error']['Code'] == '404':
             s3.upload_fileobj(
@@ -145,6 +336,7 @@ def upload_buffer(buffer, name=None, file_type=None, db="STAGE"):
         else:
             raise e
 
+    known_objects.add(bucket_name, filename, db)
     return file_url, name
 
 
@@ -173,9 +365,21 @@ def upload(data: any, name=None, file_type=None, db="STAGE"):
         return upload_file(data, name, file_type, db)
 
 
+async def run_async(func, *args, **kwargs):
+    """
+    Run a blocking upload in a worker thread, sharing the pooled client, with bounded concurrency per event loop.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _async_semaphores:
+        _async_semaphores[loop] = asyncio.Semaphore(ASYNC_UPLOAD_CONCURRENCY)
+    async with _async_semaphores[loop]:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
 def copy_file_to_bucket(source_bucket, dest_bucket, source_key, dest_key=None):
     """
     Efficiently copy a file from one S3 bucket to another using server-side copy.
+    Large objects are copied in concurrent multipart chunks.
     
     Args:
         source_bucket (str): Source bucket name
@@ -193,16 +397,22 @@ def copy_file_to_bucket(source_bucket, dest_bucket, source_key, dest_key=None):
 
     file_url = f"https://{dest_bucket}.s3.amazonaws.com/{dest_key}"
 
+    db = next((db for db, bucket in s3_buckets.items() if bucket == dest_bucket), "STAGE")
+    if known_objects.contains(dest_bucket, dest_key, db):
+        return file_url
+
     try:
         s3.head_object(Bucket=dest_bucket, Key=dest_key)
     except s3.exceptions.ClientError as e:
         if e.response['Error']['Code'] == '404':
-            s3.copy_object(
-                CopySource=copy_source,
-                Bucket=dest_bucket,
-                Key=dest_key
+            s3.copy(
+                copy_source,
+                dest_bucket,
+                dest_key,
+                Config=transfer_config
             )
         else:
             raise e
 
+    known_objects.add(dest_bucket, dest_key, db)
     return file_url
\ No newline at end of file
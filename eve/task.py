@@ -3,12 +3,23 @@ from typing import Dict, Any, Optional, Literal, List
 from functools import wraps
 from datetime import datetime, timezone
 import asyncio
+import os
 
 from .user import User
 from .mongo import Document, Collection
+from .llm_clients import get_async_openai_client
 from . import eden_utils
 
 
+# number of samples of a task generated concurrently, unless the tool sets its own limit
+TASK_SAMPLE_CONCURRENCY = int(os.getenv("TASK_SAMPLE_CONCURRENCY", 4))
+
+# seconds a side task may run before it is cancelled
+TASK_SIDE_TASK_TIMEOUT = float(os.getenv("TASK_SIDE_TASK_TIMEOUT", 30))
+
+# model naming creations, creations are named after their prompt without an OpenAI API key
+TASK_NAME_MODEL = os.getenv("TASK_NAME_MODEL", "gpt-4o-mini")
+
 
 @Collection("creations3")
 class Creation(Document):
@@ -48,6 +59,7 @@ class Task(Document):
     error: Optional[str] = None
     result: Optional[List[Dict[str, Any]]] = None
     performance: Optional[Dict[str, Any]] = {}
+    sample_concurrency: Optional[int] = None
 
     def __init__(self, **data):
         if isinstance(data.get('user'), str):
@@ -79,10 +91,110 @@ def task_handler_method(func):
     return wrapper
 
 
-async def _preprocess_task(task: Task):
-    """Helper function that sleeps for 5 seconds"""
-    await asyncio.sleep(5)
-    return {"name": "this is a tbd side task"}
+def _creation_name(args: dict):
+    name = args.get("prompt") or args.get("text_input")
+    if not name:
+        name = args.get("interpolation_prompts") or args.get("interpolation_texts")
+        if name:
+            name = " to ".join(name)
+    return name
+
+
+# side tasks run concurrently with the samples of every task, by the creation field their result sets
+_side_tasks = {}
+
+
+def side_task(field: str):
+    """
+    Register an async function of a task as a side task. Its result sets `field` of the
+    creations of samples that finish after it, samples never wait for it.
+    """
+    def decorator(func):
+        _side_tasks[field] = func
+        return func
+    return decorator
+
+
+@side_task("name")
+async def _name_creation(task: Task):
+    prompt = _creation_name(task.args)
+    if not prompt or task.mock or not os.getenv("OPENAI_API_KEY"):
+        return None
+    response = await get_async_openai_client().chat.completions.create(
+        model=TASK_NAME_MODEL,
+        messages=[
+            {"role": "system", "content": "Give a short, descriptive title of at most 6 words to an artwork made from the prompt of the user. Reply with the title only."},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=24,
+    )
+    return (response.choices[0].message.content or "").strip().strip('"') or None
+
+
+def _start_side_tasks(task: Task):
+    return {
+        field: asyncio.create_task(asyncio.wait_for(func(task), TASK_SIDE_TASK_TIMEOUT))
+        for field, func in _side_tasks.items()
+    }
+
+
+def _side_task_results(side_tasks: dict):
+    """
+    Results of the side tasks that have finished successfully so far.
+    """
+    return {
+        field: side_task.result()
+        for field, side_task in side_tasks.items()
+        if side_task.done()
+        and not side_task.cancelled()
+        and side_task.exception() is None
+        and side_task.result() is not None
+    }
+
+
+def _stop_side_tasks(side_tasks: dict):
+    """
+    Cancel the side tasks still running and report the ones that failed.
+    """
+    for field, side_task in side_tasks.items():
+        if not side_task.done():
+            side_task.cancel()
+        elif not side_task.cancelled() and side_task.exception() is not None:
+            print(f"Side task {field} failed: {side_task.exception()!r}")
+
+
+async def _run_sample(func, args, task: Task, i: int, side_tasks: dict):
+    task_args = task.args.copy()
+    if "seed" in task_args:
+        task_args["seed"] = task_args["seed"] + i
+
+    result = await func(*args[:-1], task.parent_tool or task.tool, task_args, task.db)
+
+    result["output"] = result["output"] if isinstance(result["output"], list) else [result["output"]]
+    result = await eden_utils.async_upload_result(result, db=task.db, save_thumbnails=True, save_blurhash=True)
+
+    creation_fields = {"name": _creation_name(task_args), **_side_task_results(side_tasks)}
+    for output in result["output"]:
+        new_creation = Creation(
+            user=task.user,
+            requester=task.requester,
+            agent=None,
+            task=task.id,
+            tool=task.tool,
+            filename=output['filename'],
+            mediaAttributes=output['mediaAttributes'],
+            **creation_fields
+        )
+        await new_creation.async_save(db=task.db)
+        output["creation"] = new_creation.id
+
+    return result
+
+
+async def _refund(task: Task, n_failed: int, n_samples: int):
+    refund_amount = (task.cost or 0) * n_failed / n_samples
+    user = await User.async_from_mongo(task.user, db=task.db)
+    await user.async_refund_manna(refund_amount)
 
 
 async def _task_handler(func, *args, **kwargs):
@@ -91,61 +203,48 @@ async def _task_handler(func, *args, **kwargs):
     start_time = datetime.now(timezone.utc)
     queue_time = (start_time - task.createdAt).total_seconds()
 
-    task.update(
+    await task.async_update(
         status="running",
         performance={"waitTime": queue_time}
     )
     
-    results = []
+    results = {}
+    errors = []
+    task_update = {}
     n_samples = task.args.get("n_samples", 1)
+    semaphore = asyncio.Semaphore(task.sample_concurrency or TASK_SAMPLE_CONCURRENCY)
+    update_lock = asyncio.Lock()
+    side_tasks = _start_side_tasks(task)
 
-    try:
-        for i in range(n_samples):
-            task_args = task.args.copy()
-            if "seed" in task_args:
-                task_args["seed"] = task_args["seed"] + i
-
-            # Run both functions concurrently
-            main_task = func(*args[:-1], task.parent_tool or task.tool, task_args, task.db)
-            preprocess_task = _preprocess_task(task)
-            result, preprocess_result = await asyncio.gather(main_task, preprocess_task)
-            
-            result["output"] = result["output"] if isinstance(result["output"], list) else [result["output"]]
-            result = eden_utils.upload_result(result, db=task.db, save_thumbnails=True, save_blurhash=True)
-            
-            for output in result["output"]:
-                name = preprocess_result.get("name") or task_args.get("prompt") or args.get("text_input")
-                if not name:
-                    name = args.get("interpolation_prompts") or args.get("interpolation_texts")
-                    if name:
-                        name = " to ".join(name)
-                new_creation = Creation(
-                    user=task.user,
-                    requester=task.requester,
-                    agent=None,
-                    task=task.id,
-                    tool=task.tool,
-                    filename=output['filename'],
-                    mediaAttributes=output['mediaAttributes'],
-                    name=name
+    async def run_sample(i):
+        async with semaphore:
+            try:
+                results[i] = await _run_sample(func, args, task, i, side_tasks)
+            except Exception as error:
+                errors.append(error)
+                return
+        if len(results) + len(errors) < n_samples:
+            # stream partial results, in sample order
+            async with update_lock:
+                await task.async_update(
+                    status="running",
+                    result=[results[k] for k in sorted(results)]
                 )
-                new_creation.save(db=task.db)
-                output["creation"] = new_creation.id
 
-            results.extend([result])
+    try:
+        await asyncio.gather(*[run_sample(i) for i in range(n_samples)])
 
-            if i == n_samples - 1:
-                task_update = {
-                    "status": "completed", 
-                    "result": results
-                }
+        if not results:
+            raise errors[0]
+
+        task_update = {
+            "status": "completed", 
+            "result": [results[k] for k in sorted(results)]
+        }
 
-            else:
-                task_update = {
-                    "status": "running", 
-                    "result": results
-                }
-                task.update(**task_update)
+        if errors:
+            task_update["error"] = f"{len(errors)} of {n_samples} samples failed: {errors[0]}"
+            await _refund(task, len(errors), n_samples)
 
         return task_update.copy()
 
@@ -154,18 +253,14 @@ async def _task_handler(func, *args, **kwargs):
             "status": "failed",
             "error": str(error),
         }
-        
-        n_samples = task.args.get("n_samples", 1)
-        refund_amount = (task.cost or 0) * (n_samples - len(task.result or [])) / n_samples
-        user = User.from_mongo(task.user, db=task.db)
-        user.refund_manna(refund_amount)
-        
+        await _refund(task, n_samples - len(results), n_samples)
         return task_update.copy()
 
     finally:
+        _stop_side_tasks(side_tasks)
         run_time = datetime.now(timezone.utc) - start_time
         task_update["performance"] = {
             "waitTime": queue_time,
             "runTime": run_time.total_seconds()
         }
-        task.update(**task_update)
+        await task.async_update(**task_update)
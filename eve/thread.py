@@ -1,16 +1,38 @@
 import os
 import json
-import magic
-import copy
+import asyncio
 from bson import ObjectId
 from datetime import datetime, timezone
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from pydantic.config import ConfigDict
 from pydantic.json_schema import SkipJsonSchema
 from typing import List, Optional, Dict, Any, Literal, Union
 
-from .mongo import Document, Collection
-from .eden_utils import download_file, image_to_base64, prepare_result, dump_json
+from pymongo import ASCENDING, DESCENDING
+
+from .mongo import Document, Collection, get_collection, get_async_collection, _get_item_type_adapter
+from .eden_utils import get_image_block, is_image_block_cached, prepare_result, dump_json
+from .file_cache import file_cache
+
+
+# token budget of the message history sent to each model, leaving room for the system message, tools and reply
+THREAD_TOKEN_BUDGETS = {
+    "claude-3-5-sonnet-20241022": 80000,
+    "gpt-4o-mini": 64000,
+    "gpt-4o-2024-08-06": 64000,
+}
+THREAD_DEFAULT_TOKEN_BUDGET = int(os.getenv("THREAD_DEFAULT_TOKEN_BUDGET", 16000))
+
+# fraction of its budget a window is trimmed to once it outgrows it, so its start (the prompt cache prefix) stays put for a while
+THREAD_WINDOW_SLACK = float(os.getenv("THREAD_WINDOW_SLACK", 0.75))
+
+# rough token cost of an image block, resized to 512px
+IMAGE_TOKENS = 350
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, without running a tokenizer"""
+    return len(text) // 4 + 1
 
 
 class ChatMessage(BaseModel):
@@ -35,6 +57,14 @@ class UserMessage(ChatMessage):
     metadata: Optional[Dict[str, Any]] = {}
     attachments: Optional[List[str]] = []
 
+    def estimate_tokens(self):
+        attachments = self.attachments or []
+        text = (self.name or "") + (self.content or "") + "".join(attachments)
+        return estimate_tokens(text) + IMAGE_TOKENS * len(attachments)
+
+    def media_urls(self, schema):
+        return list(self.attachments or [])
+
     def _get_content(self, schema, truncate_images=False):
         """Assemble user message content block"""
 
@@ -48,20 +78,17 @@ class UserMessage(ChatMessage):
         if self.attachments:
             # append attachments info (url and type) to content
             attachment_lines = []
-            attachment_files = []
+            attachment_blocks = []
             attachment_errors = []
             for attachment in self.attachments:
                 try:
-                    attachment_file = download_file(
+                    image_block = get_image_block(
                         attachment,
-                        os.path.join(
-                            "/tmp/eden_file_cache/", attachment.split("/")[-1]
-                        ),
-                        overwrite=False,
+                        schema,
+                        truncate=truncate_images,
                     )
-                    attachment_files.append(attachment_file)
-                    mime_type = magic.from_file(attachment_file, mime=True)
-                    if "video" in mime_type:
+                    attachment_blocks.append(image_block["block"])
+                    if "video" in image_block["mime_type"]:
                         attachment_lines.append(
                             f"* {attachment} (The asset is a video, the corresponding image attachment is its first frame.)"
                         )
@@ -81,39 +108,7 @@ class UserMessage(ChatMessage):
             content += f"\n{attachments}"
 
             # add image blocks
-            if schema == "anthropic":
-                block = [
-                    {
-                        "type": "image",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "image/jpeg",
-                            "data": image_to_base64(
-                                file_path,
-                                max_size=512,
-                                quality=95,
-                                truncate=truncate_images,
-                            ),
-                        },
-                    }
-                    for file_path in attachment_files
-                ]
-            elif schema == "openai":
-                block = [
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"""data:image/jpeg;base64,{image_to_base64(
-                            file_path, 
-                            max_size=512, 
-                            quality=95, 
-                            truncate=truncate_images
-                        )}"""
-                        },
-                    }
-                    for file_path in attachment_files
-                ]
-
+            block = attachment_blocks
             if content:
                 block.extend([{"type": "text", "text": content.strip()}])
 
@@ -157,69 +152,30 @@ class ToolCall(BaseModel):
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    def estimate_tokens(self):
+        tokens = estimate_tokens(self.tool + json.dumps(self.args, default=str) + (self.error or ""))
+        if self.status == "completed" and self.result:
+            tokens += estimate_tokens(json.dumps(self.result, default=str))
+            tokens += IMAGE_TOKENS * sum(len(r.get("output", [])) for r in self.result)
+        return tokens
+
     def get_result(self, schema, truncate_images=False):
         result = {"status": self.status}
 
         if self.status == "completed":
             result["result"] = prepare_result(self.result, db=self.db)
-            outputs = [
-                o.get("url")
-                for r in result.get("result", [])
-                for o in r.get("output", [])
-            ]
-            outputs = [
-                o
-                for o in outputs
-                if o and o.endswith((".jpg", ".png", ".webp", ".mp4", ".webm"))
-            ]
+            outputs = _media_output_urls(result["result"])
             try:
                 if schema == "openai":
                     raise ValueError(
                         "OpenAI does not support image outputs in tool messages :("
                     )
 
-                files = [
-                    download_file(
-                        url,
-                        os.path.join("/tmp/eden_file_cache/", url.split("/")[-1]),
-                        overwrite=False,
-                    )
+                image_block = [
+                    get_image_block(url, schema, truncate=truncate_images)["block"]
                     for url in outputs
                 ]
 
-                if schema == "anthropic":
-                    image_block = [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": image_to_base64(
-                                    file_path,
-                                    max_size=512,
-                                    quality=95,
-                                    truncate=truncate_images,
-                                ),
-                            },
-                        }
-                        for file_path in files
-                    ]
-                elif schema == "openai":
-                    image_block = [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"""data:image/jpeg;base64,{image_to_base64(
-                                file_path, 
-                                max_size=512, 
-                                quality=95, 
-                                truncate=truncate_images
-                            )}"""
-                            },
-                        }
-                        for file_path in files
-                    ]
-
                 if image_block:
                     content = "Tool results follow. The attached images match the URLs in the order they appear below: "
                     # content += json.dumps(result["result"])
@@ -242,6 +198,12 @@ class ToolCall(BaseModel):
 
         return result
 
+    def media_urls(self, schema):
+        # OpenAI does not support image outputs in tool messages
+        if self.status != "completed" or schema == "openai":
+            return []
+        return _media_output_urls(prepare_result(self.result, db=self.db))
+
     def react(self, user: ObjectId, reaction: str):
         pass
 
@@ -303,6 +265,12 @@ class AssistantMessage(ChatMessage):
     content: Optional[str] = None
     tool_calls: Optional[List[ToolCall]] = []
 
+    def estimate_tokens(self):
+        return estimate_tokens(self.content or "") + sum(t.estimate_tokens() for t in self.tool_calls or [])
+
+    def media_urls(self, schema):
+        return [url for t in self.tool_calls or [] for url in t.media_urls(schema)]
+
     def openai_schema(self, truncate_images=False):
         schema = [
             {
@@ -349,7 +317,107 @@ class AssistantMessage(ChatMessage):
             )
         return schema
 
-    
+
+def _media_output_urls(result):
+    outputs = [
+        o.get("url")
+        for r in result or []
+        for o in r.get("output", [])
+    ]
+    return [
+        o
+        for o in outputs
+        if o and o.endswith((".jpg", ".png", ".webp", ".mp4", ".webm"))
+    ]
+
+
+async def async_prefetch_media(messages, schema):
+    """
+    Download the media of a window of messages concurrently, so rendering them for a provider schema doesn't wait on serial downloads.
+    Failed downloads are left for rendering to report.
+    """
+    urls = dict.fromkeys(url for message in messages for url in message.media_urls(schema))
+    urls = [url for url in urls if not is_image_block_cached(url, schema)]
+    if urls:
+        await asyncio.gather(*[file_cache.async_fetch(url) for url in urls], return_exceptions=True)
+
+
+# where new threads keep their messages: "embedded" in the thread document, or in their own "collection"
+THREAD_MESSAGE_STORAGE = os.getenv("THREAD_MESSAGE_STORAGE", "embedded")
+
+# number of most recent messages cached on the thread document in "collection" mode
+THREAD_MESSAGE_CACHE_SIZE = int(os.getenv("THREAD_MESSAGE_CACHE_SIZE", 50))
+
+
+@Collection("messages3")
+class MessageStore:
+    """
+    Messages of threads in "collection" mode, one document per message, indexed by (thread, createdAt).
+    Timestamps only have millisecond precision in MongoDB, so _id breaks ties.
+    """
+
+    _indexed_dbs = set()
+    _index = [("thread", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)]
+    _sort = [("createdAt", DESCENDING), ("_id", DESCENDING)]
+
+    @classmethod
+    def get_collection(cls, db: str):
+        collection = get_collection(cls.collection_name, db)
+        if db not in cls._indexed_dbs:
+            collection.create_index(cls._index)
+            cls._indexed_dbs.add(db)
+        return collection
+
+    @classmethod
+    def async_get_collection(cls, db: str):
+        return get_async_collection(cls.collection_name, db)
+
+    @classmethod
+    async def _async_create_index(cls, db: str):
+        # with Motor, so the event loop is never blocked on index creation
+        if db not in cls._indexed_dbs:
+            await cls.async_get_collection(db).create_index(cls._index)
+            cls._indexed_dbs.add(db)
+
+    @staticmethod
+    def to_mongo(thread_id: ObjectId, message: Union[UserMessage, AssistantMessage, dict]) -> dict:
+        message = message.model_dump() if isinstance(message, BaseModel) else dict(message)
+        return {"_id": message.pop("id"), "thread": thread_id, **message}
+
+    @staticmethod
+    def from_mongo(document: dict) -> Union[UserMessage, AssistantMessage]:
+        document["id"] = document.pop("_id")
+        document.pop("thread", None)
+        message_cls = UserMessage if document.get("role") == "user" else AssistantMessage
+        return message_cls(**document)
+
+    @classmethod
+    def insert(cls, thread_id: ObjectId, messages: List, db: str):
+        cls.get_collection(db).insert_many([cls.to_mongo(thread_id, m) for m in messages])
+
+    @classmethod
+    async def async_insert(cls, thread_id: ObjectId, messages: List, db: str):
+        await cls._async_create_index(db)
+        await cls.async_get_collection(db).insert_many([cls.to_mongo(thread_id, m) for m in messages])
+
+    @classmethod
+    def find(cls, thread_id: ObjectId, limit: int, db: str):
+        """
+        Get the last `limit` messages of a thread, oldest first.
+        """
+        cursor = cls.get_collection(db).find({"thread": thread_id}).sort(cls._sort).limit(limit)
+        return [cls.from_mongo(m) for m in reversed(list(cursor))]
+
+    @classmethod
+    async def async_find(cls, thread_id: ObjectId, limit: int, db: str):
+        """
+        Async version of find.
+        """
+        await cls._async_create_index(db)
+        cursor = cls.async_get_collection(db).find({"thread": thread_id}).sort(cls._sort).limit(limit)
+        return [cls.from_mongo(m) for m in reversed(await cursor.to_list(length=limit))]
+
+
 @Collection("threads3")
 class Thread(Document):
     key: Optional[str] = None
@@ -358,6 +426,12 @@ class Thread(Document):
     user: Optional[ObjectId] = None
     messages: List[Union[UserMessage, AssistantMessage]] = Field(default_factory=list)
     active: List[ObjectId] = Field(default_factory=list)
+    message_storage: Optional[Literal["embedded", "collection"]] = "embedded"
+
+    # last message window served by get_messages, as ((token_budget, limit, messages list, length), window)
+    _message_window: Optional[tuple] = PrivateAttr(default=None)
+    # first message id of the last window, by (token_budget, limit)
+    _message_window_starts: dict = PrivateAttr(default_factory=dict)
 
     @classmethod
     def load(cls, key, agent=None, user=None, create_if_missing=False, db="STAGE"):
@@ -371,32 +445,232 @@ class Thread(Document):
             thread = Thread(db=db, **thread)
         else:
             if create_if_missing:
-                thread = cls(db=db, key=key, agent=agent, user=user)
+                thread = cls(db=db, key=key, agent=agent, user=user, message_storage=THREAD_MESSAGE_STORAGE)
                 thread.save()
             else:
                 raise Exception(f"Thread {key} with agent {agent} not found in {cls.collection_name}:{db}")        
         return thread
 
+    @classmethod
+    async def async_load(cls, key, agent=None, user=None, create_if_missing=False, db="STAGE"):
+        filter = {"key": key}
+        if agent:
+            filter["agent"] = agent
+        if user:
+            filter["user"] = user
+        thread = await cls.async_get_collection(db).find_one(filter)
+        if thread:
+            thread = Thread(db=db, **thread)
+        else:
+            if create_if_missing:
+                thread = cls(db=db, key=key, agent=agent, user=user, message_storage=THREAD_MESSAGE_STORAGE)
+                await thread.async_save()
+            else:
+                raise Exception(f"Thread {key} with agent {agent} not found in {cls.collection_name}:{db}")
+        return thread
+
+    def push(
+        self, 
+        pushes: Dict[str, Union[Any, List[Any]]] = {},
+        pulls: Dict[str, Any] = {}
+    ):
+        if self.message_storage == "collection" and pushes.get("messages"):
+            pushes = self._validate_pushed_messages(pushes)
+            MessageStore.insert(self.id, pushes["messages"], db=self.db)
+        super().push(pushes, pulls)
+
+    async def async_push(
+        self, 
+        pushes: Dict[str, Union[Any, List[Any]]] = {},
+        pulls: Dict[str, Any] = {}
+    ):
+        if self.message_storage == "collection" and pushes.get("messages"):
+            pushes = self._validate_pushed_messages(pushes)
+            await MessageStore.async_insert(self.id, pushes["messages"], db=self.db)
+        await super().async_push(pushes, pulls)
+
+    @staticmethod
+    def _validate_pushed_messages(pushes):
+        """
+        Validate pushed messages before they are stored, so an invalid message is never inserted.
+        """
+        messages = pushes["messages"]
+        adapter = _get_item_type_adapter(Thread, "messages")
+        messages = [adapter.validate_python(m) for m in (messages if isinstance(messages, list) else [messages])]
+        return {**pushes, "messages": messages}
+
+    def _prepare_push(
+        self, 
+        pushes: Dict[str, Union[Any, List[Any]]] = {},
+        pulls: Dict[str, Any] = {}
+    ) -> dict:
+        update_ops = super()._prepare_push(pushes, pulls)
+        if "messages" in update_ops.get("$push", {}):
+            self._message_window = None
+        if self.message_storage == "collection" and "messages" in update_ops.get("$push", {}):
+            # only keep a tail cache of messages in the thread document
+            update_ops["$push"]["messages"]["$slice"] = -THREAD_MESSAGE_CACHE_SIZE
+            del self.messages[:-THREAD_MESSAGE_CACHE_SIZE]
+        return update_ops
+
     def update_tool_call(self, message_id, tool_call_index, updates):
+        if self.message_storage == "collection":
+            self._update_stored_message(message_id, tool_call_index, updates)
+        updates, array_filters = self._prepare_tool_call_update(message_id, tool_call_index, updates)
+        self.set_against_filter(updates, array_filters=array_filters)
+
+    async def async_update_tool_call(self, message_id, tool_call_index, updates):
+        if self.message_storage == "collection":
+            await self._async_update_stored_message(message_id, tool_call_index, updates)
+        updates, array_filters = self._prepare_tool_call_update(message_id, tool_call_index, updates)
+        await self.async_set_against_filter(updates, array_filters=array_filters)
+
+    def _prepare_tool_call_update(self, message_id, tool_call_index, updates):
         # Update the in-memory object
         message = next(m for m in self.messages if m.id == message_id)
+        self._message_window = None
         for key, value in updates.items():
             setattr(message.tool_calls[tool_call_index], key, value)
-        # Update the database
+        # Build the database update. An array filter (rather than the positional $ operator) 
+        # addresses the message, so updates to different tool calls can be batched together
+        identifier = f"m{message_id}"
         updates = {
-            f"messages.$.tool_calls.{tool_call_index}.{k}": v
+            f"messages.$[{identifier}].tool_calls.{tool_call_index}.{k}": v
             for k, v in updates.items()
         }
-        self.set_against_filter(updates, filter={"messages.id": message_id})
+        return updates, [{f"{identifier}.id": message_id}]
 
-    def get_messages(self, filters=None):
+    def _stored_message_update(self, tool_call_index, updates):
+        return {
+            "$set": {
+                f"tool_calls.{tool_call_index}.{k}": v
+                for k, v in updates.items()
+            }
+        }
+
+    def _update_stored_message(self, message_id, tool_call_index, updates):
+        update = self._stored_message_update(tool_call_index, updates)
+        if self._write_buffer is not None:
+            self._write_buffer.add(MessageStore, self.db, {"_id": message_id}, update)
+        else:
+            MessageStore.get_collection(self.db).update_one({"_id": message_id}, update)
+
+    async def _async_update_stored_message(self, message_id, tool_call_index, updates):
+        update = self._stored_message_update(tool_call_index, updates)
+        if self._write_buffer is not None:
+            self._write_buffer.add(MessageStore, self.db, {"_id": message_id}, update)
+        else:
+            await MessageStore.async_get_collection(self.db).update_one({"_id": message_id}, update)
+
+    def _has_message_window(self, limit: int):
+        """
+        Whether the in-memory messages are enough to serve the last `limit` messages.
+        """
+        return (
+            self.message_storage != "collection"
+            or len(self.messages) >= limit
+            or len(self.messages) < THREAD_MESSAGE_CACHE_SIZE  # the cache holds the whole thread
+        )
+
+    def _is_message_cache_truncated(self):
+        """
+        Whether older messages of the thread may precede the in-memory messages.
+        """
+        return self.message_storage == "collection" and len(self.messages) >= THREAD_MESSAGE_CACHE_SIZE
+
+    def migrate_messages(self):
+        """
+        Move the embedded messages of this thread into the messages collection, keeping only a tail cache.
+        """
+        if self.message_storage == "collection":
+            return
+        if self.messages:
+            MessageStore.insert(self.id, self.messages, db=self.db)
+        self.messages = self.messages[-THREAD_MESSAGE_CACHE_SIZE:]
+        self.message_storage = "collection"
+        self.save()
+
+    def get_messages(self, model: Optional[str] = None, limit: int = THREAD_MESSAGE_CACHE_SIZE):
+        """
+        Get the most recent messages that fit in the token budget of `model`, up to `limit` of them.
+        The window is an immutable view of the thread's own message objects, cached until the next push.
+        """
         # filter by time, number, or prompt
         # if reply to inside messages, mark it
         # if reply to by old message, include context leading up to it
-        # self.reload()
-        messages = copy.deepcopy(self.messages[-15:])
-        # hack to remove any spurious assistant messages at end
-        # todo: should try to actually fix this bug
-        while messages and messages[-1].role == "assistant":
-            messages.pop()
-        return messages
\ No newline at end of file
+        window, key = self._cached_message_window(model, limit)
+        if window is None:
+            if self._has_message_window(limit):
+                messages, truncated = self.messages, self._is_message_cache_truncated()
+            else:
+                messages = MessageStore.find(self.id, limit, db=self.db)
+                truncated = len(messages) >= limit
+            window = self._set_message_window(key, messages, limit, truncated)
+        return window
+
+    async def async_get_messages(self, model: Optional[str] = None, limit: int = THREAD_MESSAGE_CACHE_SIZE):
+        window, key = self._cached_message_window(model, limit)
+        if window is None:
+            if self._has_message_window(limit):
+                messages, truncated = self.messages, self._is_message_cache_truncated()
+            else:
+                messages = await MessageStore.async_find(self.id, limit, db=self.db)
+                truncated = len(messages) >= limit
+            window = self._set_message_window(key, messages, limit, truncated)
+        return window
+
+    def _cached_message_window(self, model: Optional[str], limit: int):
+        token_budget = THREAD_TOKEN_BUDGETS.get(model, THREAD_DEFAULT_TOKEN_BUDGET)
+        # the messages list and its length catch reloads and local appends
+        key = (token_budget, limit, id(self.messages), len(self.messages))
+        if self._message_window and self._message_window[0] == key:
+            return self._message_window[1], key
+        return None, key
+
+    def _set_message_window(self, key, messages, limit, truncated=False):
+        start_key = key[:2]
+        window = _select_message_window(
+            messages,
+            limit,
+            token_budget=key[0],
+            start_id=self._message_window_starts.get(start_key),
+            truncated=truncated,
+        )
+        if window:
+            self._message_window_starts[start_key] = window[0].id
+        self._message_window = (key, window)
+        return window
+
+
+def _select_message_window(messages, limit, token_budget, start_id=None, truncated=False):
+    """
+    Select the most recent messages fitting in token_budget, without copying them.
+    The last message is always included. A window keeps starting at start_id, the start of the
+    previous window, for as long as it fits, so the prefix sent to the model stays the same.
+    truncated means messages is only the tail of the thread, e.g. its tail cache or a slice of the store.
+    """
+    end = len(messages)
+    # hack to remove any spurious assistant messages at end
+    # todo: should try to actually fix this bug
+    while end and messages[end - 1].role == "assistant":
+        end -= 1
+    if start_id is not None:
+        start = next((i for i in range(end - 1, -1, -1) if messages[i].id == start_id), None)
+        if start is not None and end - start <= limit and sum(
+            m.estimate_tokens() for m in messages[start:end]
+        ) <= token_budget:
+            return tuple(messages[start:end])
+        # the previous window outgrew its budget, leave room for it to grow again
+        limit = max(1, int(limit * THREAD_WINDOW_SLACK))
+        token_budget = int(token_budget * THREAD_WINDOW_SLACK)
+    start, tokens = end, 0
+    while start > max(0, end - limit):
+        tokens += messages[start - 1].estimate_tokens()
+        if tokens > token_budget and start < end:
+            break
+        start -= 1
+    # a truncated window must start with a user message
+    if start > 0 or truncated:
+        while start < end and messages[start].role == "assistant":
+            start += 1
+    return tuple(messages[start:end])
@@ -6,7 +6,7 @@ import random
 import asyncio
 import traceback
 from abc import ABC, abstractmethod
-from pydantic import BaseModel, create_model, ValidationError
+from pydantic import BaseModel, PrivateAttr, create_model, ValidationError
 from typing import Optional, List, Dict, Any, Type, Literal
 from datetime import datetime, timezone
 from instructor.function_calls import openai_schema
@@ -46,8 +46,12 @@ class Tool(Document, ABC):
     parameters: Optional[Dict[str, Any]] = None
     parameter_presets: Optional[Dict[str, Any]] = None
     gpu: Optional[str] = None    
+    sample_concurrency: Optional[int] = None
     test_args: Optional[Dict[str, Any]] = None
 
+    # provider schemas of this version of the tool, as ((updatedAt, model), {(provider, exclude_hidden): schema})
+    _provider_schemas: Optional[tuple] = PrivateAttr(default=None)
+
     @classmethod
     def _get_schema(cls, key: str, from_yaml: bool = False, db: str = "STAGE") -> dict:
         if from_yaml:
@@ -166,6 +170,9 @@ class Tool(Document, ABC):
     def save(self, db=None, **kwargs):
         return super().save(db, {"key": self.key}, **kwargs)
 
+    async def async_save(self, db=None, **kwargs):
+        return await super().async_save(db, {"key": self.key}, **kwargs)
+
     @classmethod
     def load(cls, key, db=None):
         return super().load(key=key, db=db)
@@ -179,14 +186,32 @@ class Tool(Document, ABC):
             del parameters['properties'][k]
         parameters['required'] = [k for k in parameters.get('required', []) if k not in hidden_parameters]
 
+    def _cached_provider_schema(self, provider: str, exclude_hidden: bool, build) -> dict[str, Any]:
+        """
+        Get a provider schema, built once per version of the tool. Cached schemas are shared, do not mutate them.
+        """
+        version = (self.updatedAt, self.model)
+        if self._provider_schemas is None or self._provider_schemas[0] != version:
+            self._provider_schemas = (version, {})
+        schemas = self._provider_schemas[1]
+        if (provider, exclude_hidden) not in schemas:
+            schemas[(provider, exclude_hidden)] = build(exclude_hidden)
+        return schemas[(provider, exclude_hidden)]
+
     def anthropic_schema(self, exclude_hidden: bool = False) -> dict[str, Any]:
+        return self._cached_provider_schema("anthropic", exclude_hidden, self._build_anthropic_schema)
+
+    def openai_schema(self, exclude_hidden: bool = False) -> dict[str, Any]:
+        return self._cached_provider_schema("openai", exclude_hidden, self._build_openai_schema)
+
+    def _build_anthropic_schema(self, exclude_hidden: bool) -> dict[str, Any]:
         schema = openai_schema(self.model).anthropic_schema
         schema["input_schema"].pop("description")  # duplicated
         if exclude_hidden:
             self._remove_hidden_fields(schema["input_schema"])
         return schema
 
-    def openai_schema(self, exclude_hidden: bool = False) -> dict[str, Any]:
+    def _build_openai_schema(self, exclude_hidden: bool) -> dict[str, Any]:
         schema = openai_schema(self.model).openai_schema
         if exclude_hidden:
             self._remove_hidden_fields(schema["parameters"])
@@ -244,7 +269,7 @@ class Tool(Document, ABC):
                     result = await run_function(self, args, db)
                 result["output"] = result["output"] if isinstance(result["output"], list) else [result["output"]]
                 sentry_sdk.add_breadcrumb(category="handle_run", data=result)
-                result = eden_utils.upload_result(result, db)
+                result = await eden_utils.async_upload_result(result, db)
                 sentry_sdk.add_breadcrumb(category="handle_run", data=result)
                 result["status"] = "completed"
             except Exception as e:
@@ -264,10 +289,10 @@ class Tool(Document, ABC):
                 args = self.prepare_args(args)
                 sentry_sdk.add_breadcrumb(category="handle_start_task", data=args)                
                 cost = self.calculate_cost(args)
-                user = User.from_mongo(user_id, db=db)
+                user = await User.async_from_mongo(user_id, db=db)
                 if "freeTools" in (user.featureFlags or []):
                     cost = 0
-                user.check_manna(cost)
+                await user.async_check_manna(cost)
                 
             except Exception as e:
                 print(traceback.format_exc())
@@ -283,8 +308,9 @@ class Tool(Document, ABC):
                 args=args, 
                 mock=mock,
                 cost=cost,
+                sample_concurrency=self.sample_concurrency,
             )
-            task.save(db=db)
+            await task.async_save(db=db)
             sentry_sdk.add_breadcrumb(category="handle_start_task", data=task.model_dump())
 
             # start task
@@ -292,8 +318,8 @@ class Tool(Document, ABC):
                 if mock:
                     handler_id = eden_utils.random_string()
                     output = {"output": eden_utils.mock_image(args)}
-                    result = eden_utils.upload_result(output, db=db)
-                    task.update(
+                    result = await eden_utils.async_upload_result(output, db=db)
+                    await task.async_update(
                         handler_id=handler_id,
                         status="completed", 
                         result=result,
@@ -301,13 +327,13 @@ class Tool(Document, ABC):
                     )
                 else:
                     handler_id = await start_task_function(self, task)
-                    task.update(handler_id=handler_id)
+                    await task.async_update(handler_id=handler_id)
 
-                user.spend_manna(task.cost)            
+                await user.async_spend_manna(task.cost)            
 
             except Exception as e:
                 print(traceback.format_exc())
-                task.update(status="failed", error=str(e))
+                await task.async_update(status="failed", error=str(e))
                 sentry_sdk.capture_exception(e)
                 raise Exception(f"Task failed: {e}. No manna deducted.")
             
@@ -320,7 +346,7 @@ class Tool(Document, ABC):
 
         async def async_wrapper(self, task: Task):
             if not task.handler_id:
-                task.reload()
+                await task.async_reload()
             try:
                 if task.mock:
                     result = task.result
@@ -340,9 +366,9 @@ class Tool(Document, ABC):
             await cancel_function(self, task)
             n_samples = task.args.get("n_samples", 1)
             refund_amount = (task.cost or 0) * (n_samples - len(task.result or [])) / n_samples
-            user = User.from_mongo(task.user, db=task.db)
-            user.refund_manna(refund_amount)
-            task.update(status="cancelled")
+            user = await User.async_from_mongo(task.user, db=task.db)
+            await user.async_refund_manna(refund_amount)
+            await task.async_update(status="cancelled")
         
         return async_wrapper
 
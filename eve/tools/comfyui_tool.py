@@ -24,6 +24,8 @@ class ComfyUITool(Tool):
     comfyui_output_node_id: int
     comfyui_intermediate_outputs: Optional[Dict[str, int]] = None
     comfyui_map: Dict[str, ComfyUIInfo] = Field(default_factory=dict)
+    # one workflow runs at a time on a ComfyUI server
+    sample_concurrency: Optional[int] = 1
 
     @classmethod
     def convert_from_yaml(cls, schema: dict, file_path: str = None) -> dict:
@@ -58,7 +60,7 @@ class ComfyUITool(Tool):
     async def async_wait(self, task: Task):
         fc = modal.functions.FunctionCall.from_id(task.handler_id)
         await fc.get.aio()
-        task.reload()
+        await task.async_reload()
         return task.model_dump(include={"status", "error", "result"})
         
     @Tool.handle_cancel
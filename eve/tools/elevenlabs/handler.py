@@ -3,10 +3,10 @@ import random
 from tempfile import NamedTemporaryFile
 from typing import List, Literal
 from elevenlabs.client import ElevenLabs, VoiceSettings, Voice
-from openai import OpenAI
 from typing import Iterator
 import instructor
 from ... import eden_utils
+from ...llm_clients import get_openai_client
 
 eleven = ElevenLabs()
 
@@ -76,7 +76,7 @@ def select_random_voice(
     voices = response.voices
     random.shuffle(voices)
 
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
 
     if autofilter_by_gender and not gender:
         prompt = f"""You are given the following description of a person:
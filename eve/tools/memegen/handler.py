@@ -1,11 +1,11 @@
 from pydantic import BaseModel, Field
-from openai import OpenAI
 from PIL import Image, ImageDraw, ImageFont
 import textwrap
 from pydantic import ConfigDict
 
 import instructor
 from ...eden_utils import download_file
+from ...llm_clients import get_openai_client
 
 async def handler(args: dict, db: str):   
     # print("args", args)
@@ -26,7 +26,7 @@ async def handler(args: dict, db: str):
             }
         )
 
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     meme = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
         response_model=DrakepostingMeme,
@@ -32,7 +32,7 @@ class ModalTool(Tool):
     async def async_wait(self, task: Task):
         fc = modal.functions.FunctionCall.from_id(task.handler_id)
         await fc.get.aio()
-        task.reload()
+        await task.async_reload()
         return task.model_dump(include={"status", "error", "result"})
     
     @Tool.handle_cancel
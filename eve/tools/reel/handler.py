@@ -10,13 +10,13 @@ from io import BytesIO
 from pydub import AudioSegment
 from pydub.utils import ratio_to_db
 from pydantic import BaseModel, Field
-from openai import OpenAI
 from typing import List, Optional, Literal
 import requests
 import instructor
 
 from ... import s3
 from ... import eden_utils
+from ...llm_clients import get_openai_client
 # import voice
 # from tool import load_tool_from_dir
 
@@ -32,7 +32,7 @@ class Character(BaseModel):
 
 
 def extract_characters(prompt: str):
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     characters = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
         response_model=Optional[List[Character]],
@@ -51,13 +51,13 @@ def extract_characters(prompt: str):
     
 
 def prompt_variations(prompt: str, n: int):
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
 
     class PromptVariations(BaseModel):
         prompts: List[str] = Field(..., description="A unique variation of the original prompt")
 
     user_message = f"You are given the following prompt for a short-form video: {prompt}. Generate EXACTLY {n} variations of this prompt. Don't get too fancy or creative, just state the same thing in different ways, using synonyms or different phrase constructions."
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     prompts = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
         response_model=PromptVariations,
@@ -112,7 +112,7 @@ def write_reel23(
     
     Do not include an introduction or restatement of the prompt, just go straight into the reel itself."""
 
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     
     reel = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
@@ -189,7 +189,7 @@ def write_reel(
     #     voiceover='In the heart of a hidden forest, Verdelis stumbled upon a realm where reality twisted into magic. Her eyes widened at the sight of a mystical creature, shimmering with ethereal elegance, its eyes holding ancient secrets and untold stories. In this moment, the ordinary paused, and an extraordinary bond was born.', music_prompt='A mystical, enchanting orchestral piece with soft strings and ethereal woodwinds, creating a sense of wonder and discovery. The music is gentle and flowing, capturing the magical atmosphere of the forest encounter.', visual_prompt="A serene, enchanted forest with dappled sunlight filtering through lush green leaves. The scene shows Verdelis, a young adventurer dressed in earth-toned attire, floating gracefully through the trees. She encounters a mystical creature—a unicorn-like being with shimmering iridescent skin and an elegant presence. The forest is vibrant with colors, and there's a magical aura surrounding the creature, creating an ethereal glow that illuminates the scene, capturing a moment of awe and wonder."
     # )
 
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     reel = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
         response_model=Reel,
@@ -229,7 +229,7 @@ def write_visual_prompts(
         """A sequence of visual prompts which retell the story of the Reel"""
         prompts: List[str] = Field(..., description="A sequence of visual prompts, containing a content description, and a set of self-similar stylistic modifiers and aesthetic elements, mirroring the style of the original visual prompt.")
 
-    client = instructor.from_openai(OpenAI())
+    client = instructor.from_openai(get_openai_client())
     result = client.chat.completions.create(
         model="gpt-4o-2024-08-06",
         response_model=VisualPrompts,
@@ -44,7 +44,7 @@ class ReplicateTool(Tool):
             result = {
                 "output": replicate.run(replicate_model, input=args)
             }
-        result = eden_utils.upload_result(result, db=db)
+        result = await eden_utils.async_upload_result(result, db=db)
         return result
 
     @Tool.handle_start_task
@@ -60,7 +60,7 @@ class ReplicateTool(Tool):
             # So just get run and finish task immediately
             replicate_model = self._get_replicate_model(task.args)
             output = replicate.run(replicate_model, input=args)
-            replicate_update_task(task, "succeeded", None, output, "normal")
+            await asyncio.to_thread(replicate_update_task, task, "succeeded", None, output, "normal")
             handler_id = eden_utils.random_string(28)  # make up a fake Replicate id
             return handler_id
 
@@ -74,7 +74,8 @@ class ReplicateTool(Tool):
             while True:
                 if prediction.status != status:
                     status = prediction.status
-                    result = replicate_update_task(
+                    result = await asyncio.to_thread(
+                        replicate_update_task,
                         task,
                         status, 
                         prediction.error, 
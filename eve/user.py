@@ -27,19 +27,50 @@ class Manna(Document):
             print(e)
             raise e
 
+    @classmethod
+    async def async_load(cls, user: ObjectId | str, db=None):
+        """
+        Async version of load.
+        """
+        try:
+            user = ObjectId(user) if isinstance(user, str) else user
+            return await super().async_load(user=user, db=db)
+        except MongoDocumentNotFound as e:
+            # if mannas not found, check if user exists, and create a new manna document
+            user = await User.async_from_mongo(user, db=db)
+            if not user:
+                raise Exception(f"User {user} not found")
+            manna = Manna(user=user.id, db=db)
+            await manna.async_save()
+            return manna
+        except Exception as e:
+            print(e)
+            raise e
+
     def spend(self, amount: float):
+        self._spend(amount)
+        self.save()
+
+    async def async_spend(self, amount: float):
+        self._spend(amount)
+        await self.async_save()
+
+    def _spend(self, amount: float):
         subscription_spend = min(self.subscriptionBalance, amount)
         self.subscriptionBalance -= subscription_spend
         self.balance -= (amount - subscription_spend)
         if self.balance < 0:
             raise Exception(f"Insufficient manna balance. Need {amount} but only have {self.balance + self.subscriptionBalance}")
-        self.save()
 
     def refund(self, amount: float):
         # todo: make it refund to subscription balance first if it spent from there
         self.balance += amount
         self.save()
 
+    async def async_refund(self, amount: float):
+        self.balance += amount
+        await self.async_save()
+
 
 @Collection("users3")
 class User(Document):
@@ -78,6 +109,14 @@ class User(Document):
 
     def check_manna(self, amount: float):
         manna = Manna.load(self.id, db=self.db)
+        self._check_balance(manna, amount)
+
+    async def async_check_manna(self, amount: float):
+        manna = await Manna.async_load(self.id, db=self.db)
+        self._check_balance(manna, amount)
+
+    @staticmethod
+    def _check_balance(manna: Manna, amount: float):
         total_balance = manna.balance + manna.subscriptionBalance
         if total_balance < amount:
             raise Exception(
@@ -90,12 +129,24 @@ class User(Document):
         manna = Manna.load(self.id, db=self.db)
         manna.spend(amount)
 
+    async def async_spend_manna(self, amount: float):
+        if amount == 0:
+            return
+        manna = await Manna.async_load(self.id, db=self.db)
+        await manna.async_spend(amount)
+
     def refund_manna(self, amount: float):
         if amount == 0:
             return
         manna = Manna.load(self.id, db=self.db)
         manna.refund(amount)
 
+    async def async_refund_manna(self, amount: float):
+        if amount == 0:
+            return
+        manna = await Manna.async_load(self.id, db=self.db)
+        await manna.async_refund(amount)
+
     @classmethod
     def from_discord(cls, discord_id, discord_username, db="STAGE"):
         discord_id = str(discord_id)
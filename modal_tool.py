@@ -31,7 +31,7 @@ image = (
 @app.function(image=image, timeout=3600)
 async def run(tool_key: str, args: dict, db: str):
     result = await handlers[tool_key](args, db=db)
-    return eden_utils.upload_result(result, db=db)
+    return await eden_utils.async_upload_result(result, db=db)
 
 @app.function(image=image, timeout=3600)
 @task_handler_func
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from eve.tool import Tool
 
 
@@ -30,3 +31,17 @@ def test_tool():
             {'type': 'phone', 'value': '555-1234'}
         ]
     }
+
+
+def test_tool_schemas_are_cached():
+    tool = Tool.from_yaml('eve/tools/example_tool/api.yaml')
+
+    schema = tool.anthropic_schema(exclude_hidden=True)
+    assert tool.anthropic_schema(exclude_hidden=True) is schema
+    assert tool.anthropic_schema() is not schema
+    assert tool.openai_schema(exclude_hidden=True)["function"]["name"] == schema["name"]
+
+    # a new version of the tool rebuilds its schemas
+    tool.updatedAt = datetime.now(timezone.utc)
+    assert tool.anthropic_schema(exclude_hidden=True) is not schema
+    assert tool.anthropic_schema(exclude_hidden=True) == schema
@@ -0,0 +1,89 @@
+import os
+import time
+import blurhash
+import numpy as np
+import pytest
+from PIL import Image
+
+from eve.eden_utils import get_blurhash
+
+
+# wall-clock assertions flake on loaded machines, so benchmarks only assert on their timings with EDEN_ASSERT_TIMINGS=1
+ASSERT_TIMINGS = os.getenv("EDEN_ASSERT_TIMINGS") == "1"
+
+
+def make_image(width, height):
+    """
+    Make a deterministic test image with smooth gradients and some high frequency detail
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    r = 255 * x / width
+    g = 255 * y / height
+    b = 127 + 127 * np.sin(x / 37.0) * np.cos(y / 23.0)
+    pixels = np.stack([r, g, b], axis=-1).clip(0, 255).astype(np.uint8)
+    return Image.fromarray(pixels)
+
+
+def best_of(func, n=3):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def decode(hash):
+    return np.array(blurhash.decode(hash, 32, 32), dtype=np.float64)
+
+
+def test_blurhash_matches_reference():
+    """
+    Without downsampling, the vectorized encoder matches the reference implementation exactly
+    """
+
+    image = make_image(48, 32)
+    assert get_blurhash(image) == blurhash.encode(np.array(image), 4, 4)
+
+
+@pytest.mark.parametrize("width,height", [(2560, 30), (30, 2560), (1, 1)])
+def test_blurhash_extreme_aspect_ratios(width, height):
+    """
+    The short side of a very wide or tall image never downsamples to nothing
+    """
+
+    image = make_image(width, height)
+    hash = get_blurhash(image)
+    assert len(hash) == 36
+    assert np.isfinite(decode(hash)).all()
+
+
+@pytest.mark.parametrize("width,height", [
+    (1024, 1024),  # flux, sdxl
+    (1344, 768),   # flux landscape
+    (832, 1216),   # sdxl portrait
+])
+def test_blurhash_benchmark(width, height):
+    """
+    Benchmark: blurhash of full size outputs against the reference implementation on a 100px thumbnail
+    """
+
+    image = make_image(width, height)
+
+    def fast():
+        return get_blurhash(image)
+
+    def reference():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((100, 100), Image.LANCZOS)
+        return blurhash.encode(np.array(thumbnail), 4, 4)
+
+    hash, fast_time = best_of(fast)
+    reference_hash, reference_time = best_of(reference)
+
+    print(f"\n{width}x{height}: {fast_time * 1000:.1f}ms, reference on 100px thumbnail: {reference_time * 1000:.1f}ms")
+
+    # the hashes decode to nearly the same placeholder
+    assert np.abs(decode(hash) - decode(reference_hash)).mean() < 8
+    if ASSERT_TIMINGS:
+        assert fast_time < reference_time
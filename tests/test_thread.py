@@ -0,0 +1,151 @@
+import os
+import copy
+import time
+import pytest
+from pydantic import ValidationError
+
+from eve.thread import Thread, UserMessage, AssistantMessage, ToolCall, THREAD_DEFAULT_TOKEN_BUDGET, THREAD_WINDOW_SLACK, THREAD_MESSAGE_CACHE_SIZE
+
+
+# wall-clock assertions flake on loaded machines, so benchmarks only assert on their timings with EDEN_ASSERT_TIMINGS=1
+ASSERT_TIMINGS = os.getenv("EDEN_ASSERT_TIMINGS") == "1"
+
+
+def make_thread(n_messages):
+    """
+    Make a thread with n_messages of history, alternating user messages and assistant messages with tool results
+    """
+    messages = []
+    for i in range(n_messages // 2):
+        messages.append(UserMessage(name="jim", content=f"make a picture of a fancy dog #{i}"))
+        messages.append(AssistantMessage(content="", tool_calls=[
+            ToolCall(
+                id=f"toolu_{i}",
+                tool="flux_schnell",
+                args={"prompt": f"a fancy dog #{i}", "n_samples": 2},
+                db="STAGE",
+                status="completed",
+                result=[{"output": [{"filename": f"{i}_{j}.png", "mediaAttributes": {"width": 1024, "height": 1024}}]} for j in range(2)],
+            )
+        ]))
+    return Thread(db="STAGE", key="test", messages=messages)
+
+
+def time_pushes(thread, n_pushes=200):
+    start = time.perf_counter()
+    for i in range(n_pushes):
+        thread._prepare_push({"messages": UserMessage(content=f"message {i}")})
+    return (time.perf_counter() - start) / n_pushes
+
+
+def test_push_validates_new_items():
+    """
+    Pushed items are validated against the item type of the field, and appended to the local instance
+    """
+
+    thread = make_thread(4)
+    message = UserMessage(content="hello")
+    update = thread._prepare_push({"messages": [message, {"role": "assistant", "content": "hi"}]})
+
+    assert thread.messages[-2] is message
+    assert isinstance(thread.messages[-1], AssistantMessage)
+    assert [m["content"] for m in update["$push"]["messages"]["$each"]] == ["hello", "hi"]
+
+    with pytest.raises(ValidationError):
+        thread._prepare_push({"messages": {"role": "system", "content": "not a chat message"}})
+
+
+def test_push_cost_is_constant():
+    """
+    Micro-benchmark: the cost of a push does not grow with the length of the message history
+    """
+
+    short_thread = make_thread(10)
+    long_thread = make_thread(2000)
+    history = list(long_thread.messages)
+
+    time_pushes(short_thread, 20)  # warm up cached type adapters
+    short_time = min(time_pushes(short_thread) for _ in range(3))
+    long_time = min(time_pushes(long_thread) for _ in range(3))
+
+    print(f"\npush with 10 messages: {short_time * 1e6:.1f}us, with 2000 messages: {long_time * 1e6:.1f}us")
+
+    # the history is neither copied nor revalidated, only the pushed message is appended
+    assert all(a is b for a, b in zip(long_thread.messages, history))
+    assert len(long_thread.messages) == len(history) + 3 * 200
+    if ASSERT_TIMINGS:
+        assert long_time < 3 * short_time
+
+
+def test_message_window():
+    """
+    The message window is a token-budgeted view of the thread's own messages, cached until the next push
+    """
+
+    thread = make_thread(400)
+
+    window = thread.get_messages(limit=400)
+    assert isinstance(window, tuple)
+    assert window[-1] is thread.messages[-2]  # trailing assistant message is dropped
+    assert window[0].role == "user"
+    assert 0 < len(window) < 399
+    assert sum(m.estimate_tokens() for m in window) <= THREAD_DEFAULT_TOKEN_BUDGET
+    assert thread.get_messages(limit=400) is window
+
+    assert len(thread.get_messages(model="gpt-4o-mini", limit=5)) == 5
+
+    thread._prepare_push({"messages": UserMessage(content="one more")})
+    window = thread.get_messages(limit=400)
+    assert window[-1] is thread.messages[-1]
+
+
+def test_message_window_prefix_is_stable():
+    """
+    Once a window outgrows its budget, it is trimmed with slack, and keeps its start until it outgrows it again
+    """
+
+    thread = make_thread(400)
+    starts = []
+    for i in range(40):
+        thread._prepare_push({"messages": UserMessage(content=f"{i} " + "a long message " * 150)})
+        window = thread.get_messages(limit=400)
+        assert window[-1] is thread.messages[-1]
+        assert sum(m.estimate_tokens() for m in window) <= THREAD_DEFAULT_TOKEN_BUDGET
+        starts.append(window[0].id)
+
+    # the start moves rarely, not on every push
+    assert 1 < len(set(starts)) <= 8
+    assert sum(m.estimate_tokens() for m in thread.get_messages(limit=400)) > THREAD_WINDOW_SLACK * THREAD_DEFAULT_TOKEN_BUDGET / 2
+
+
+def test_rendering_leaves_messages_untouched():
+    """
+    The window hands out the thread's own messages, so rendering them for a provider must not change their tool results
+    """
+
+    thread = make_thread(4)
+    before = copy.deepcopy([m.tool_calls[0].result for m in thread.messages if m.role == "assistant"])
+
+    for message in thread.get_messages():
+        message.media_urls("anthropic")
+    for message in thread.get_messages():
+        message.openai_schema()
+
+    after = [m.tool_calls[0].result for m in thread.messages if m.role == "assistant"]
+    assert after == before
+
+
+def test_message_window_of_tail_cache_starts_with_user_message():
+    """
+    In "collection" mode a full tail cache is itself truncated, so a window starting at its first message still starts with a user message
+    """
+
+    thread = make_thread(100)
+    thread.message_storage = "collection"
+    thread.messages = thread.messages[-(THREAD_MESSAGE_CACHE_SIZE - 1):] + [UserMessage(content="one more")]
+    assert thread.messages[0].role == "assistant"
+
+    window = thread.get_messages(model="claude-3-5-sonnet-20241022")
+    assert window[0].role == "user"
+    assert window[0] is thread.messages[1]
+    assert window[-1] is thread.messages[-1]
@@ -0,0 +1,42 @@
+from PIL import Image
+
+from eve.eden_utils import get_thumbnail_ladder
+
+
+def test_thumbnail_ladder_sizes():
+    image = Image.new("RGB", (3000, 2000))
+    thumbnails = get_thumbnail_ladder(image)
+
+    assert {w: t.size for w, t in thumbnails.items()} == {
+        2560: (2560, 1707),
+        1024: (1024, 683),
+        768: (768, 512),
+        384: (384, 256),
+    }
+
+
+def test_thumbnail_ladder_keeps_original():
+    """
+    Widths at or above the width of the image get the original, even when it is taller than max_height
+    """
+
+    image = Image.new("RGBA", (2000, 5000))
+    thumbnails = get_thumbnail_ladder(image)
+
+    assert thumbnails[2560] is image
+    assert thumbnails[1024].size == (1024, 2560)
+    assert thumbnails[384].size == (384, 960)
+
+
+def test_thumbnail_ladder_matches_direct_resize():
+    """
+    Deriving each size from the previous one gives the same sizes as thumbnailing the original
+    """
+
+    for size in [(1141, 2645), (3763, 889), (845, 835), (2903, 108)]:
+        image = Image.new("L", size)
+        for width, thumbnail in get_thumbnail_ladder(image).items():
+            expected = image.copy()
+            if width < image.width:
+                expected.thumbnail((width, 2560))
+            assert thumbnail.size == expected.size